@@ -0,0 +1,8 @@
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+
+def is_shared(alias):
+    """False for caches living inside one process, whose entries never reach the other workers."""
+    return not isinstance(caches[alias], (LocMemCache, DummyCache))
@@ -0,0 +1,34 @@
+from django.db.backends.mysql import base
+
+from ..pool import get_limiter
+from .operations import DatabaseOperations
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    MySQL backend that takes a slot from the per-worker ConnectionLimiter
+    for every physical connection it opens and gives it back on close, or
+    when the thread that opened it exits. Its operations also read back the
+    BINARY(16) ids of BinaryUUIDField.
+    """
+    ops_class = DatabaseOperations
+
+    def get_new_connection(self, conn_params):
+        limiter = get_limiter(self.alias, self.settings_dict.get('POOL', {}))
+        limiter.acquire()
+        try:
+            connection = super().get_new_connection(conn_params)
+        except Exception:
+            limiter.release()
+            raise
+        self._pool_slot = limiter.hold(connection)
+        return connection
+
+    def _close(self):
+        try:
+            return super()._close()
+        finally:
+            slot = getattr(self, '_pool_slot', None)
+            if slot is not None:
+                self._pool_slot = None
+                slot.release()
@@ -0,0 +1,11 @@
+import uuid
+
+from django.db.backends.mysql import operations
+
+
+class DatabaseOperations(operations.DatabaseOperations):
+    def convert_uuidfield_value(self, value, expression, connection):
+        # BINARY(16) columns (myapp.fields.BinaryUUIDField) come back as raw bytes
+        if isinstance(value, (bytes, bytearray)):
+            return uuid.UUID(bytes=bytes(value))
+        return super().convert_uuidfield_value(value, expression, connection)
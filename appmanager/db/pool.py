@@ -0,0 +1,142 @@
+import threading
+import time
+import weakref
+from collections import deque
+
+from django.db import OperationalError
+
+
+class ConnectionLimiter:
+    """
+    Caps how many DB connections one worker process holds at a time.
+
+    Combined with CONN_MAX_AGE each thread keeps its connection between
+    requests, so this acts as a per-worker pool: a thread that needs a new
+    connection while the pool is full waits up to `timeout` seconds for a
+    slot. Checkout waits, saturation and connection churn are recorded.
+
+    A slot is tied to the thread that opened the connection (see `hold`):
+    under runserver and ASGI every request runs on a short-lived thread
+    that exits without closing its persistent connection.
+    """
+
+    def __init__(self, size, timeout):
+        self.size = size
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._opened = deque()
+        self.in_use = 0
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.reclaimed = 0
+
+    def acquire(self):
+        started = time.monotonic()
+        acquired = self._slots.acquire(timeout=self.timeout)
+        waited = time.monotonic() - started
+        with self._lock:
+            if not acquired:
+                self.timeouts += 1
+            else:
+                self.in_use += 1
+                self.checkouts += 1
+                self.total_wait += waited
+                self.max_wait = max(self.max_wait, waited)
+                self._opened.append(started)
+        if not acquired:
+            raise OperationalError(f'Timed out after {self.timeout}s waiting for a DB connection slot ({self.size} in use).')
+
+    def release(self):
+        with self._lock:
+            self.in_use -= 1
+        self._slots.release()
+
+    def hold(self, connection):
+        """
+        Bind an acquired slot to `connection` (a DB-API connection) and the
+        calling thread. Returns a Slot to release on close; if the thread
+        exits first, the connection is closed and the slot given back then.
+        """
+        return Slot(self, connection)
+
+    def reclaim(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            # already closed or broken, the slot is what matters
+            pass
+        with self._lock:
+            self.reclaimed += 1
+        self.release()
+
+    def opened_last_minute(self):
+        cutoff = time.monotonic() - 60
+        with self._lock:
+            while self._opened and self._opened[0] < cutoff:
+                self._opened.popleft()
+            return len(self._opened)
+
+    def stats(self):
+        opened = self.opened_last_minute()
+        with self._lock:
+            return {
+                'size': self.size,
+                'in_use': self.in_use,
+                'saturation': self.in_use / self.size,
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'avg_wait_ms': self.total_wait / self.checkouts * 1000 if self.checkouts else 0.0,
+                'max_wait_ms': self.max_wait * 1000,
+                'opened_last_minute': opened,
+                'reclaimed': self.reclaimed,
+            }
+
+
+class _ThreadToken:
+    pass
+
+
+_thread_tokens = threading.local()
+
+
+def thread_token():
+    # freed as soon as the thread exits: thread-local values are dropped
+    # with the thread, and nothing else references the token
+    token = getattr(_thread_tokens, 'token', None)
+    if token is None:
+        token = _thread_tokens.token = _ThreadToken()
+    return token
+
+
+class Slot:
+    def __init__(self, limiter, connection):
+        self._limiter = limiter
+        self._finalizer = weakref.finalize(thread_token(), limiter.reclaim, connection)
+
+    def release(self):
+        # detach() returns None when the thread exit already reclaimed it
+        if self._finalizer.detach() is not None:
+            self._limiter.release()
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(alias, pool_settings):
+    with _limiters_lock:
+        if alias not in _limiters:
+            _limiters[alias] = ConnectionLimiter(
+                size=pool_settings.get('SIZE', 10),
+                timeout=pool_settings.get('TIMEOUT', 5),
+            )
+        return _limiters[alias]
+
+
+def pool_stats():
+    with _limiters_lock:
+        limiters = dict(_limiters)
+    return {alias: limiter.stats() for alias, limiter in limiters.items()}
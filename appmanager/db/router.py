@@ -0,0 +1,49 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# set while the current request (or command) must read from the primary
+use_primary = ContextVar('use_primary', default=False)
+
+# tokens are read on the primary so one issued a moment ago authenticates
+# on the very next request; the token cache keeps these reads rare
+PRIMARY_ONLY_MODELS = {'authtoken.token'}
+
+
+@contextmanager
+def primary():
+    """Route every read in the block to the primary."""
+    token = use_primary.set(True)
+    try:
+        yield
+    finally:
+        use_primary.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Sends reads to one of the DATABASE_REPLICAS aliases and writes to
+    `default`.
+
+    Reads stay on the primary while `use_primary` is set (see
+    myapp.middleware.ReplicaPinningMiddleware) and inside a transaction on
+    the primary, which has to see its own uncommitted rows.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if not replicas or use_primary.get() or model._meta.label_lower in PRIMARY_ONLY_MODELS:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same rows as the primary
+        return True
@@ -54,23 +54,58 @@ REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
         'myapp.authentication.ExpiringTokenAuthentication',
     ],
 }
 TOKEN_EXPIRED_AFTER_SECONDS = 1000
+# how long an authenticated token (and its user) is served from the cache before re-checking
+# the DB, 0 disables the token cache (off by default without REDIS_URL)
+TOKEN_CACHE_SECONDS = int(os.getenv('TOKEN_CACHE_SECONDS', 60 if os.getenv('REDIS_URL') else 0))
+# apps a user may own, unset means unlimited (checked against User.app_count)
+MAX_APPS_PER_USER = int(os.environ['MAX_APPS_PER_USER']) if os.getenv('MAX_APPS_PER_USER') else None
+# cache alias shared by all workers for the plan catalogue, unset keeps it in process memory
+PLAN_CATALOGUE_CACHE = os.getenv('PLAN_CATALOGUE_CACHE') or None
+# cache alias holding the catalogue version that in-memory copies are checked against, must be shared by all workers
+PLAN_CATALOGUE_VERSIONS = os.getenv('PLAN_CATALOGUE_VERSIONS', 'default')
+# cache alias for per-user API responses (myapp.response_cache), unset keeps them in a per-worker LRU
+RESPONSE_CACHE = os.getenv('RESPONSE_CACHE') or None
+# size of that per-worker LRU
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', 10000))
+# how long a cached response is kept, 0 disables the response cache (off by default without REDIS_URL)
+RESPONSE_CACHE_SECONDS = int(os.getenv('RESPONSE_CACHE_SECONDS', 60 if os.getenv('REDIS_URL') else 0))
+# cache alias holding the per-user generations, must be shared by all workers (checked at startup)
+RESPONSE_CACHE_GENERATIONS = os.getenv('RESPONSE_CACHE_GENERATIONS', 'default')
+# change feed entries older than this are dropped by `manage.py compact_changes`, and older cursors refused
+CHANGE_FEED_RETENTION_DAYS = int(os.getenv('CHANGE_FEED_RETENTION_DAYS', 7))
 
 
 MIDDLEWARE = [
+    # no-op unless PROFILING_SAMPLE_RATE > 0
+    'myapp.middleware.ProfilingMiddleware',
+    # no-op unless DATABASE_REPLICAS is set
+    'myapp.middleware.ReplicaPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    # the Site* middleware are the stock session, CSRF, auth and messages
+    # middleware, skipped for API_PATH_PREFIX
+    'myapp.middleware.SiteSessionMiddleware',
     'django.middleware.common.CommonMiddleware',
-    'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
-    'django.contrib.messages.middleware.MessageMiddleware',
+    'myapp.middleware.SiteCsrfViewMiddleware',
+    'myapp.middleware.SiteAuthenticationMiddleware',
+    'myapp.middleware.SiteMessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# token-only API mount: no sessions, CSRF or messages under this prefix
+API_PATH_PREFIX = '/api/v1/'
+
+# fraction of requests profiled by myapp.middleware.ProfilingMiddleware (0 disables it)
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', 0))
+# where each worker writes its histograms for `manage.py dump_profiles`
+PROFILING_DUMP_DIR = os.getenv('PROFILING_DUMP_DIR', str(BASE_DIR / 'profiles'))
+PROFILING_FLUSH_SECONDS = int(os.getenv('PROFILING_FLUSH_SECONDS', 30))
+# dumps not rewritten for this long come from workers that are gone, `dump_profiles` skips them
+PROFILING_DUMP_WINDOW_SECONDS = int(os.getenv('PROFILING_DUMP_WINDOW_SECONDS', 3600))
+
 ROOT_URLCONF = 'appmanager.urls'
 
 TEMPLATES = [
@@ -103,15 +138,46 @@ WSGI_APPLICATION = 'appmanager.wsgi.application'
 # }
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.mysql', 
+        # django.db.backends.mysql plus a per-worker connection limiter (appmanager/db/pool.py)
+        'ENGINE': 'appmanager.db.mysql', 
         'NAME': os.getenv('DB_NAME'),
         'USER': os.getenv('DB_USER'),
         'PASSWORD': os.getenv('DB_PASSWORD'),
         'HOST': os.getenv('DB_HOST'),
         'PORT': os.getenv('DB_PORT'),
+        # keep connections open between requests and ping them before reuse
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 300)),
+        'CONN_HEALTH_CHECKS': os.getenv('DB_CONN_HEALTH_CHECKS', 'true').lower() == 'true',
+        'POOL': {
+            # max connections per worker process, size it to the worker's thread count
+            'SIZE': int(os.getenv('DB_POOL_SIZE', 10)),
+            # seconds to wait for a free slot before failing the request
+            'TIMEOUT': float(os.getenv('DB_POOL_TIMEOUT', 5)),
+        },
     }
 }
 
+# read replicas, comma separated hosts sharing the primary's credentials
+DATABASE_REPLICAS = []
+for index, host in enumerate(filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(','))):
+    DATABASES[f'replica{index}'] = {**DATABASES['default'], 'HOST': host.strip(), 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(f'replica{index}')
+
+DATABASE_ROUTERS = ['appmanager.db.router.ReplicaRouter']
+# seconds a client keeps reading from the primary after a write, should cover the replication lag
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', 5))
+# cache alias holding those pins, must be shared by all workers (checked at startup)
+REPLICA_PIN_CACHE = os.getenv('REPLICA_PIN_CACHE', 'default')
+
+
+# shared by all workers: auth tokens, replica pins and response cache generations live
+# here. REDIS_URL needs the redis package; unset keeps a per-process cache, which only
+# suits a single worker (runserver, tests)
+if os.getenv('REDIS_URL'):
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': os.getenv('REDIS_URL')}}
+else:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -132,6 +198,24 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Password hashing
+# https://docs.djangoproject.com/en/4.2/topics/auth/passwords/
+# The first hasher hashes new passwords, the rest only verify (and are
+# upgraded on login). PASSWORD_HASHER_PROFILE=argon2 needs argon2-cffi.
+
+PASSWORD_HASH_ITERATIONS = int(os.getenv('PASSWORD_HASH_ITERATIONS', 600000))
+
+PASSWORD_HASHERS = [
+    'myapp.hashers.ConfigurablePBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+if os.getenv('PASSWORD_HASHER_PROFILE', 'pbkdf2') == 'argon2':
+    PASSWORD_HASHERS.insert(0, PASSWORD_HASHERS.pop(2))
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/4.2/topics/i18n/
 
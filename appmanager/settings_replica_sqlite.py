@@ -0,0 +1,36 @@
+"""
+Local setup for the read-replica router: two SQLite files standing in for
+the primary and one replica.
+
+Nothing replicates between the files, so a read that lands on the wrong
+database visibly misses the rows the primary just wrote, which is what the
+routing tests rely on:
+
+    python manage.py test myapp.tests.ReplicaRoutingTestCase myapp.tests.ReplicaRouterTestCase \
+        --settings=appmanager.settings_replica_sqlite
+
+(the rest of the suite expects an in-memory database, its async tests
+share the test transaction's connection)
+"""
+import tempfile
+
+from .settings import *  # noqa: F401,F403
+
+SECRET_KEY = SECRET_KEY or 'local-replica-setup'
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+    },
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db_replica.sqlite3',
+        # schema straight from the models, data migrations write through the router to the primary
+        'TEST': {'NAME': BASE_DIR / 'test_db_replica.sqlite3', 'MIGRATE': False},
+    },
+}
+DATABASE_REPLICAS = ['replica']
+# replica pins must outlive a worker's memory, a file cache stands in for Redis
+CACHES = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': f'{tempfile.gettempdir()}/appmanager-cache'}}
@@ -1,4 +1,6 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
 
 
 class MyappConfig(AppConfig):
@@ -8,3 +10,47 @@ class MyappConfig(AppConfig):
     def ready(self):
         # Import signal handlers
         import myapp.signals
+        # sampled requests count their queries on every connection opened from here on
+        from django.db.backends.signals import connection_created
+        from .profiling import install_query_recorder
+        connection_created.connect(install_query_recorder)
+        self.check_shared_caches()
+        self.configure_caches()
+        # build the validators now so the common-password list is loaded once at startup
+        from django.contrib.auth.password_validation import get_default_password_validators
+        get_default_password_validators()
+
+    def configure_caches(self):
+        # the services keep the cache objects, so this runs again whenever CACHES is swapped
+        # plans are read from memory (or the shared cache) from here on
+        from .services.plan_catalogue import plan_catalogue
+        plan_catalogue.configure(settings.PLAN_CATALOGUE_CACHE, settings.PLAN_CATALOGUE_VERSIONS)
+        from .response_cache import response_cache
+        response_cache.configure(
+            settings.RESPONSE_CACHE, settings.RESPONSE_CACHE_GENERATIONS,
+            settings.RESPONSE_CACHE_MAX_ENTRIES, settings.RESPONSE_CACHE_SECONDS,
+        )
+
+    def check_shared_caches(self):
+        # a per-process cache would leave the other workers serving stale responses,
+        # authenticating deactivated users or reading from a lagging replica right after a write
+        from appmanager.cache import is_shared
+        if settings.TOKEN_CACHE_SECONDS and not is_shared('default'):
+            raise ImproperlyConfigured(
+                'TOKEN_CACHE_SECONDS needs the default cache shared by all workers (set REDIS_URL), '
+                'or 0 to disable the token cache.'
+            )
+        if settings.DATABASE_REPLICAS and not is_shared(settings.REPLICA_PIN_CACHE):
+            raise ImproperlyConfigured(
+                'DATABASE_REPLICAS needs REPLICA_PIN_CACHE to name a cache shared by all workers (set REDIS_URL).'
+            )
+        if settings.PLAN_CATALOGUE_CACHE and not is_shared(settings.PLAN_CATALOGUE_CACHE):
+            raise ImproperlyConfigured(
+                'PLAN_CATALOGUE_CACHE must name a cache shared by all workers, or be unset to keep the '
+                'catalogue in process memory (checked against PLAN_CATALOGUE_VERSIONS).'
+            )
+        if settings.RESPONSE_CACHE_SECONDS and not is_shared(settings.RESPONSE_CACHE_GENERATIONS):
+            raise ImproperlyConfigured(
+                'RESPONSE_CACHE_SECONDS needs RESPONSE_CACHE_GENERATIONS to name a cache shared by all workers '
+                '(set REDIS_URL), or 0 to disable the response cache.'
+            )
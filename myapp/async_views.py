@@ -0,0 +1,59 @@
+from functools import wraps
+
+from django.http import Http404
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .authentication import ExpiringTokenAuthentication
+from .responses import json_response
+from .services.app_service import AppService
+from .services.subscription_service import SubscriptionService, PlanService
+
+# Async (ASGI-native) variants of the read endpoints. DRF's @api_view is
+# sync only, so these authenticate with the async token path themselves
+# and render with DRF's JSONRenderer to keep responses identical.
+
+
+def async_api_view(view):
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return json_response({'detail': f'Method "{request.method}" not allowed.'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+        try:
+            result = await ExpiringTokenAuthentication().aauthenticate(request)
+            if result is None:
+                return json_response({'detail': 'Authentication credentials were not provided.'}, status=status.HTTP_401_UNAUTHORIZED)
+            request.user, request.auth = result
+            return await view(request, *args, **kwargs)
+        except APIException as e:
+            return json_response({'detail': e.detail}, status=e.status_code)
+    return wrapper
+
+
+@async_api_view
+async def get_user_apps(request):
+    app_service = AppService()
+    return await app_service.aget_apps_for_user(request.user, request)
+
+@async_api_view
+async def get_app(request, app_id):
+    app_service = AppService()
+    try:
+        return await app_service.aget_app(request.user, app_id, request)
+    except Http404 as e:
+        return json_response({'error': str(e)}, status=status.HTTP_404_NOT_FOUND)
+
+@async_api_view
+async def get_user_app_subscription(request, app_id):
+    subscription_service = SubscriptionService()
+    return await subscription_service.aget_subscription(request.user, app_id, request)
+
+@async_api_view
+async def get_user_subscriptions(request):
+    subscription_service = SubscriptionService()
+    return await subscription_service.aget_user_subscriptions(request.user, request)
+
+@async_api_view
+async def get_plans(request):
+    plan_service = PlanService()
+    return await plan_service.aget_plans(request)
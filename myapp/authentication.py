@@ -1,16 +1,36 @@
-from rest_framework.authentication import TokenAuthentication
+from asgiref.sync import sync_to_async
+from rest_framework.authentication import TokenAuthentication, get_authorization_header
 from rest_framework.authtoken.models import Token
 from rest_framework.exceptions import AuthenticationFailed
 
 from datetime import timedelta
 from django.utils import timezone
 from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
 
+from .profiling import profile_methods
 
 
+TOKEN_CACHE_PREFIX = 'auth_token:'
+
+
+def token_cache_key(key):
+    return f'{TOKEN_CACHE_PREFIX}{key}'
+
+# drop a token from the auth cache, called whenever a token is deleted or rotated
+def invalidate_cached_token(key):
+    cache.delete(token_cache_key(key))
+
+# accepts a Token instance or a key, only hits the DB for a bare key
+def _resolve_token(token):
+    if isinstance(token, Token):
+        return token
+    return Token.objects.get(key=token)
+
 #this return left time
 def expires_in(token):
-    token = Token.objects.get(key=token)
+    token = _resolve_token(token)
     time_elapsed = timezone.now() - token.created
     left_time = timedelta(seconds = settings.TOKEN_EXPIRED_AFTER_SECONDS) - time_elapsed
     return left_time
@@ -19,36 +39,116 @@ def expires_in(token):
 def is_token_expired(token):
     return expires_in(token) < timedelta(seconds = 0)
 
+# give the token a new key and creation time with a single UPDATE; when a
+# concurrent request rotated it first (no row matched) its token is returned
+# instead, None if the token was deleted meanwhile
+def rotate_token(token):
+    old_key = token.key
+    new_key = token.generate_key()
+    created = timezone.now()
+    rotated = Token.objects.filter(key = old_key).update(key = new_key, created = created)
+    invalidate_cached_token(old_key)
+    if not rotated:
+        return Token.objects.filter(user_id = token.user_id).first()
+    token.key, token.created = new_key, created
+    return token
+
 # if token is expired new token will be established
-# If token is expired then it will be removed
-# and new one with different key will be created
+# If token is expired then it will be rotated
+# to a new key and creation time
 def token_expire_handler(token):
-    token = Token.objects.get(key=token)
-    is_expired = is_token_expired(token.key)
+    token = _resolve_token(token)
+    is_expired = is_token_expired(token)
     if is_expired:
-        token.delete()
-        token = Token.objects.create(user = token.user)
-    return is_expired, token.key
+        token = rotate_token(token)
+    return is_expired, token.key if token else None
 
+# current token for a user, created or rotated as needed (at most two statements
+# unless it races another login of the same user)
+def issue_token(user):
+    token = Token.objects.filter(user = user).first()
+    if token is not None and is_token_expired(token):
+        token = rotate_token(token)
+    if token is not None:
+        return token
+    try:
+        # savepoint, so losing the race leaves an enclosing transaction usable
+        with transaction.atomic():
+            return Token.objects.create(user = user)
+    except IntegrityError:
+        # a concurrent first login created it (one token per user)
+        return Token.objects.get(user = user)
 
 #________________________________________________
 #DEFAULT_AUTHENTICATION_CLASSES
+@profile_methods('auth', names=['authenticate', 'aauthenticate'])
 class ExpiringTokenAuthentication(TokenAuthentication):
     """
     If token is expired then it will be removed
     and new one with different key will be created
+
+    The token and its user are loaded with a single joined query and kept
+    in the cache for TOKEN_CACHE_SECONDS (never past the token's expiry).
     """
     def authenticate_credentials(self, key):
-        try:
-            token = Token.objects.get(key = key)
-        except Token.DoesNotExist:
-            raise AuthenticationFailed("Invalid Token")
-        
+        cache_key = token_cache_key(key)
+        token = cache.get(cache_key)
+        from_cache = token is not None
+        if not from_cache:
+            try:
+                token = Token.objects.select_related('user').get(key = key)
+            except Token.DoesNotExist:
+                raise AuthenticationFailed("Invalid Token")
+
+        left_time = self.check_token(key, token)
+        if left_time < timedelta(seconds = 0):
+            # rotate the expired token, which also evicts it from the cache
+            token_expire_handler(token)
+            raise AuthenticationFailed("The Token is expired")
+
+        timeout = min(settings.TOKEN_CACHE_SECONDS, int(left_time.total_seconds()))
+        if not from_cache and timeout > 0:
+            cache.set(cache_key, token, timeout)
+
+        return (token.user, token)
+
+    def check_token(self, key, token):
+        # returns the token's remaining lifetime
         if not token.user.is_active:
+            invalidate_cached_token(key)
             raise AuthenticationFailed("User is not active")
+        return expires_in(token)
 
-        is_expired, token = token_expire_handler(token)
-        if is_expired:
+    # async counterparts used by the ASGI read endpoints
+    async def aauthenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) != 2:
+            raise AuthenticationFailed("Invalid token header.")
+        try:
+            key = auth[1].decode()
+        except UnicodeError:
+            raise AuthenticationFailed("Invalid token header.")
+        return await self.aauthenticate_credentials(key)
+
+    async def aauthenticate_credentials(self, key):
+        cache_key = token_cache_key(key)
+        token = await cache.aget(cache_key)
+        from_cache = token is not None
+        if not from_cache:
+            try:
+                token = await Token.objects.select_related('user').aget(key = key)
+            except Token.DoesNotExist:
+                raise AuthenticationFailed("Invalid Token")
+
+        left_time = self.check_token(key, token)
+        if left_time < timedelta(seconds = 0):
+            await sync_to_async(token_expire_handler)(token)
             raise AuthenticationFailed("The Token is expired")
-        
-        return (token.user, token)
\ No newline at end of file
+
+        timeout = min(settings.TOKEN_CACHE_SECONDS, int(left_time.total_seconds()))
+        if not from_cache and timeout > 0:
+            await cache.aset(cache_key, token, timeout)
+
+        return (token.user, token)
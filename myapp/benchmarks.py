@@ -0,0 +1,285 @@
+"""
+Query-count and latency benchmarks for the /api/v1/ endpoints.
+
+Every endpoint is exercised against users owning N apps (and N
+subscriptions). For each size we record the queries one request issues,
+p50/p99 latency and peak Python allocations. An endpoint whose query count
+at the largest N differs from the smallest N is reported as a regression:
+every endpoint here must cost a constant number of queries.
+
+Run through `manage.py benchmark_endpoints`, which sets up a throwaway test
+database (SQLite or MySQL, whatever DATABASES points at).
+
+`run_key_benchmark` (`manage.py benchmark_ids`) compares primary key
+generators instead: insert throughput and table/index size of uuid4 against
+uuid7 keys, in the column type BinaryUUIDField uses on that database.
+"""
+import statistics
+import time
+import tracemalloc
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DatabaseError, connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from .fields import BinaryUUIDField
+from .ids import uuid7
+from .models import App, Plan, Subscription
+from .services.change_service import ChangeFeedService
+from .services.subscription_service import create_free_plan_subscriptions
+
+PASSWORD = 'bench-password-1'
+
+
+class BenchContext:
+    """Seeded data for one size: a user owning `size` apps, each on the Free plan."""
+
+    def __init__(self, size):
+        User = get_user_model()
+        suffix = uuid.uuid4().hex[:8]
+        self.size = size
+        self.user = User.objects.create_user(username=f'bench{size}_{suffix}', password=PASSWORD)
+        self.token = Token.objects.create(user=self.user)
+        apps = [App(user=self.user, name=f'app {i:06d}', description='benchmark app') for i in range(size)]
+        for start in range(0, size, 1000):
+            batch = App.objects.bulk_create(apps[start:start + 1000])
+            create_free_plan_subscriptions(batch)
+        self.app = apps[0]
+        self.subscription = Subscription.objects.get(app=self.app)
+
+    def fresh_app(self):
+        return App.objects.create(user=self.user, name=self.unique_name(), description='benchmark app')
+
+    def unique_name(self):
+        return f'bench_{uuid.uuid4().hex}'
+
+
+# name -> prepare(ctx) returning (method, path, data, credentials); setup
+# queries run in prepare, outside the measured request. Non-empty
+# credentials make the request from a separate client.
+def _get(name, *args):
+    return lambda ctx: ('get', reverse(name, args=[getattr(ctx, a).id for a in args]), None, {})
+
+
+def _full_page(name):
+    # largest page the paginator serves, so per-row serialization cost dominates
+    return lambda ctx: ('get', reverse(name) + '?page_size=100', None, {})
+
+
+def _register(ctx):
+    data = {'first_name': 'Bench', 'last_name': 'User', 'username': ctx.unique_name(),
+            'password': 'Sup3r-secret-pass', 'email': 'bench@example.com', 'phone': '0123456789'}
+    return 'post', reverse('register-user'), data, {}
+
+
+def _login(ctx):
+    return 'post', reverse('login'), {'username': ctx.user.username, 'password': PASSWORD}, {}
+
+
+def _logout(ctx):
+    token = Token.objects.create(user=get_user_model().objects.create_user(username=ctx.unique_name()))
+    return 'get', reverse('logout'), None, {'HTTP_AUTHORIZATION': f'Token {token.key}'}
+
+
+def _create_app(ctx):
+    return 'post', reverse('create-app'), {'name': ctx.unique_name(), 'description': 'bench'}, {}
+
+
+def _bulk_create_apps(ctx):
+    return 'post', reverse('bulk-create-apps'), [{'name': ctx.unique_name(), 'description': 'bench'} for _ in range(10)], {}
+
+
+def _update_app(ctx):
+    return 'patch', reverse('update-app', args=[ctx.app.id]), {'description': ctx.unique_name()}, {}
+
+
+def _delete_app(ctx):
+    return 'delete', reverse('delete-app', args=[ctx.fresh_app().id]), None, {}
+
+
+def _bulk_delete_apps(ctx):
+    ids = [str(ctx.fresh_app().id) for _ in range(5)]
+    return 'delete', reverse('bulk-delete-apps'), {'ids': ids}, {}
+
+
+def _update_subscription(ctx):
+    return 'patch', reverse('update-subscription', args=[ctx.subscription.id]), {'active': True}, {}
+
+
+def _bulk_change_plan(ctx):
+    # alternate between two plans so every sample changes the subscription
+    plans = list(Plan.objects.filter(name__in=['Free', 'Standard']).values_list('id', 'name'))
+    target = next(pk for pk, name in plans if pk != Subscription.objects.get(pk=ctx.subscription.pk).plan_id)
+    return 'post', reverse('bulk-change-plan'), {'plan': str(target), 'ids': [str(ctx.subscription.id)]}, {}
+
+
+def _changes(ctx):
+    # an up-to-date client polling, the common case
+    return 'get', reverse('changes') + '?cursor=' + ChangeFeedService.head(ctx.user), None, {}
+
+
+ENDPOINTS = {
+    'register-user': _register,
+    'login': _login,
+    'user-profile': _get('user-profile'),
+    'logout': _logout,
+    'create-app': _create_app,
+    'bulk-create-apps': _bulk_create_apps,
+    'bulk-delete-apps': _bulk_delete_apps,
+    'user-apps': _get('user-apps'),
+    'user-apps-page-100': _full_page('user-apps'),
+    'user-apps-include-plan': lambda ctx: ('get', reverse('user-apps') + '?include=plan', None, {}),
+    'app': _get('app', 'app'),
+    'app-include-plan': lambda ctx: ('get', reverse('app', args=[ctx.app.id]) + '?include=plan', None, {}),
+    'update-app': _update_app,
+    'delete-app': _delete_app,
+    'user-subscriptions': _get('user-subscriptions'),
+    'user-subscriptions-page-100': _full_page('user-subscriptions'),
+    'app-subscription-detail': _get('app-subscription-detail', 'app'),
+    'update-subscription': _update_subscription,
+    'bulk-change-plan': _bulk_change_plan,
+    'plans': _get('plans'),
+    'changes': _changes,
+    'async-user-apps': _get('async-user-apps'),
+    'async-app': _get('async-app', 'app'),
+    'async-user-subscriptions': _get('async-user-subscriptions'),
+    'async-app-subscription-detail': _get('async-app-subscription-detail', 'app'),
+    'async-plans': _get('async-plans'),
+}
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))
+    return ordered[index]
+
+
+def _send(client, method, path, data, credentials):
+    if credentials:
+        client = APIClient()
+        client.credentials(**credentials)
+    return getattr(client, method)(path, data, format='json')
+
+
+def measure(ctx, client, prepare, repeat):
+    queries = []
+    timings = []
+    for _ in range(repeat):
+        request = prepare(ctx)
+        # cold auth cache so every sample pays the same token lookup (benchmark_endpoints
+        # runs against a local cache, never the shared one)
+        cache.clear()
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            response = _send(client, *request)
+            timings.append((time.perf_counter() - started) * 1000)
+        if response.status_code >= 400:
+            raise AssertionError(f'{request[1]} returned {response.status_code}: {response.content[:200]!r}')
+        queries.append(len(captured))
+
+    request = prepare(ctx)
+    cache.clear()
+    tracemalloc.start()
+    _send(client, *request)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'queries': statistics.median_low(queries),
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p99_ms': round(percentile(timings, 99), 3),
+        'alloc_peak_kib': round(peak / 1024, 1),
+    }
+
+
+def run_benchmarks(sizes, repeat=20, endpoints=None):
+    """Returns {'results': [...], 'regressions': [...]} for the given app counts."""
+    selected = {name: ENDPOINTS[name] for name in (endpoints or ENDPOINTS)}
+    results = []
+    for size in sizes:
+        ctx = BenchContext(size)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {ctx.token.key}')
+        for name, prepare in selected.items():
+            results.append({'endpoint': name, 'n': size, **measure(ctx, client, prepare, repeat)})
+
+    regressions = []
+    smallest, largest = min(sizes), max(sizes)
+    by_key = {(r['endpoint'], r['n']): r for r in results}
+    for name in selected:
+        low, high = by_key[(name, smallest)]['queries'], by_key[(name, largest)]['queries']
+        if high > low:
+            regressions.append({'endpoint': name, 'queries': {smallest: low, largest: high}})
+    return {'results': results, 'regressions': regressions}
+
+
+KEY_GENERATORS = {'uuid4': uuid.uuid4, 'uuid7': uuid7}
+
+
+def _table_size(cursor, table):
+    """(data_bytes, index_bytes) of `table`, None where the database can't tell."""
+    vendor = connection.vendor
+    try:
+        if vendor == 'mysql':
+            cursor.execute(f'ANALYZE TABLE {table}')
+            cursor.fetchall()
+            cursor.execute(
+                'SELECT data_length, index_length FROM information_schema.tables '
+                'WHERE table_schema = DATABASE() AND table_name = %s', [table])
+            return tuple(cursor.fetchone())
+        if vendor == 'postgresql':
+            cursor.execute('SELECT pg_relation_size(%s), pg_indexes_size(%s)', [table, table])
+            return tuple(cursor.fetchone())
+        if vendor == 'sqlite':
+            # the rowid-less table is its primary key b-tree
+            cursor.execute(
+                'SELECT s.name, SUM(s.pgsize) FROM dbstat s JOIN sqlite_master m ON m.name = s.name '
+                'WHERE m.tbl_name = %s GROUP BY s.name', [table])
+            sizes = dict(cursor.fetchall())
+            return sizes.pop(table, 0), sum(sizes.values())
+    except DatabaseError:
+        pass
+    return None, None
+
+
+def run_key_benchmark(rows, batch_size=10000, generators=None):
+    """
+    Insert `rows` keys from each generator into its own scratch table (key
+    primary key plus an indexed integer column, the shape of an InnoDB
+    secondary index carrying the key) and report rows/s and sizes.
+    """
+    field = BinaryUUIDField()
+    key_type = field.db_type(connection)
+    without_rowid = ' WITHOUT ROWID' if connection.vendor == 'sqlite' else ''
+    results = []
+    for name in generators or KEY_GENERATORS:
+        generate = KEY_GENERATORS[name]
+        table = f'bench_keys_{name}'
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {table}')
+            cursor.execute(f'CREATE TABLE {table} (id {key_type} NOT NULL PRIMARY KEY, seq integer NOT NULL){without_rowid}')
+            cursor.execute(f'CREATE INDEX {table}_seq ON {table} (seq)')
+            sql = f'INSERT INTO {table} (id, seq) VALUES (%s, %s)'
+            elapsed = 0.0
+            for start in range(0, rows, batch_size):
+                batch = [(field.get_db_prep_value(generate(), connection), seq)
+                         for seq in range(start, min(start + batch_size, rows))]
+                started = time.perf_counter()
+                with transaction.atomic():
+                    cursor.executemany(sql, batch)
+                elapsed += time.perf_counter() - started
+            data_bytes, index_bytes = _table_size(cursor, table)
+            cursor.execute(f'DROP TABLE {table}')
+        results.append({
+            'generator': name,
+            'rows': rows,
+            'rows_per_s': round(rows / elapsed) if elapsed else None,
+            'data_bytes': data_bytes,
+            'index_bytes': index_bytes,
+        })
+    return results
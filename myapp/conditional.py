@@ -0,0 +1,35 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+
+def compute_etag(*instances, variant=''):
+    # weak etag from the identity and last write of every row in the body,
+    # `variant` tells apart different representations of the same rows
+    parts = [variant] if variant else []
+    parts += [
+        f'{instance._meta.label}:{instance.pk}:{instance.updated_at.isoformat()}'
+        for instance in instances if instance is not None
+    ]
+    digest = hashlib.md5('|'.join(parts).encode(), usedforsecurity=False).hexdigest()
+    return f'W/"{digest}"'
+
+
+def last_modified(*instances):
+    return max(int(instance.updated_at.timestamp()) for instance in instances if instance is not None)
+
+
+def conditional_response(request, instances, build_response, variant=''):
+    """
+    Answer a GET with 304 when the client already holds the current version
+    of `instances`, otherwise call `build_response` and tag its result.
+    """
+    etag = compute_etag(*instances, variant=variant)
+    modified = last_modified(*instances)
+    response = get_conditional_response(request, etag=etag, last_modified=modified)
+    if response is None:
+        response = build_response()
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(modified)
+    return response
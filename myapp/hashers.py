@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+
+class ConfigurablePBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    pbkdf2_sha256 with the work factor taken from PASSWORD_HASH_ITERATIONS.
+
+    The algorithm name is unchanged, so existing hashes keep verifying; when
+    the stored iteration count differs from the setting, Django re-hashes the
+    password on the next successful login.
+    """
+
+    @property
+    def iterations(self):
+        return settings.PASSWORD_HASH_ITERATIONS
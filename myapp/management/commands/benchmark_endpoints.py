@@ -0,0 +1,64 @@
+import json
+import platform
+from datetime import datetime, timezone
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (
+    override_settings, setup_databases, setup_test_environment, teardown_databases, teardown_test_environment,
+)
+
+from ...benchmarks import ENDPOINTS, run_benchmarks
+
+
+# the benchmark clears the cache between samples, which must never reach the shared one
+LOCAL_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmark'}}
+
+
+class Command(BaseCommand):
+    help = 'Benchmark query counts, latency and allocations of every API endpoint on a throwaway test database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1, 100, 10000], help='Apps per seeded user.')
+        parser.add_argument('--repeat', type=int, default=20, help='Requests measured per endpoint and size.')
+        parser.add_argument('--endpoint', action='append', choices=sorted(ENDPOINTS), help='Limit to these endpoints.')
+        parser.add_argument('--output', default='benchmark_results.json', help='Where to write the JSON results.')
+
+    def handle(self, *args, **options):
+        config = apps.get_app_config('myapp')
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            with override_settings(CACHES=LOCAL_CACHES, PLAN_CATALOGUE_CACHE=None, RESPONSE_CACHE=None,
+                                   PLAN_CATALOGUE_VERSIONS='default', RESPONSE_CACHE_GENERATIONS='default'):
+                config.configure_caches()
+                report = run_benchmarks(options['sizes'], options['repeat'], options['endpoint'])
+            vendor = connection.vendor
+        finally:
+            config.configure_caches()
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        report = {
+            'created': datetime.now(timezone.utc).isoformat(),
+            'database': vendor,
+            'python': platform.python_version(),
+            'sizes': options['sizes'],
+            'repeat': options['repeat'],
+            **report,
+        }
+        with open(options['output'], 'w') as output:
+            json.dump(report, output, indent=2)
+
+        for row in report['results']:
+            self.stdout.write(
+                f"{row['endpoint']:32} n={row['n']:<6} queries={row['queries']:<3} "
+                f"p50={row['p50_ms']:.2f}ms p99={row['p99_ms']:.2f}ms alloc={row['alloc_peak_kib']}KiB"
+            )
+        self.stdout.write(f"results written to {options['output']}")
+
+        if report['regressions']:
+            for regression in report['regressions']:
+                self.stderr.write(f"{regression['endpoint']}: query count grows with N {regression['queries']}")
+            raise CommandError('Query count grows with the number of apps.')
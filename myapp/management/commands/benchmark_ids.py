@@ -0,0 +1,45 @@
+import json
+import platform
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+
+from ...benchmarks import KEY_GENERATORS, run_key_benchmark
+
+
+class Command(BaseCommand):
+    help = 'Compare insert throughput and index size of uuid4 and uuid7 primary keys on a throwaway test database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10_000_000, help='Rows inserted per generator.')
+        parser.add_argument('--batch-size', type=int, default=10000, help='Rows per INSERT batch and transaction.')
+        parser.add_argument('--generator', action='append', choices=sorted(KEY_GENERATORS), help='Limit to these generators.')
+        parser.add_argument('--output', default='benchmark_ids.json', help='Where to write the JSON results.')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            results = run_key_benchmark(options['rows'], options['batch_size'], options['generator'])
+            vendor = connection.vendor
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        report = {
+            'created': datetime.now(timezone.utc).isoformat(),
+            'database': vendor,
+            'python': platform.python_version(),
+            'results': results,
+        }
+        with open(options['output'], 'w') as output:
+            json.dump(report, output, indent=2)
+
+        for row in results:
+            self.stdout.write(
+                f"{row['generator']:6} rows={row['rows']:<9} rows/s={row['rows_per_s']} "
+                f"data={row['data_bytes']}B index={row['index_bytes']}B"
+            )
+        self.stdout.write(f"results written to {options['output']}")
@@ -0,0 +1,24 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ...services.change_service import ChangeFeedService
+
+
+class Command(BaseCommand):
+    help = 'Drop superseded change feed entries and those older than the retention window.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--retention-days', type=int, default=settings.CHANGE_FEED_RETENTION_DAYS,
+            help='Keep this many days of history. Going below CHANGE_FEED_RETENTION_DAYS loses changes for clients still holding valid cursors.',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000, help='Entries deleted per statement.')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        superseded, expired = ChangeFeedService.compact(options['retention_days'], options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'removed {superseded} superseded and {expired} expired entries in {time.monotonic() - started:.2f}s'
+        ))
@@ -0,0 +1,42 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ...profiling import merge_dumps, merge_pools
+
+
+class Command(BaseCommand):
+    help = 'Print the request profiles and DB connection pool stats written by ProfilingMiddleware, merged across workers.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', default=settings.PROFILING_DUMP_DIR)
+        parser.add_argument('--window', type=int, default=settings.PROFILING_DUMP_WINDOW_SECONDS,
+                            help='Skip dumps not written in this many seconds, 0 keeps all.')
+        parser.add_argument('--json', action='store_true', help='Print the merged histograms and pool stats as JSON.')
+
+    def handle(self, *args, **options):
+        if not os.path.isdir(options['dir']):
+            raise CommandError(f"No profiles found in {options['dir']}.")
+        merged = merge_dumps(options['dir'], options['window'])
+        pools = merge_pools(options['dir'], options['window'])
+        if options['json']:
+            self.stdout.write(json.dumps({'routes': merged, 'pools': pools}, indent=2))
+            return
+
+        for route, histogram in sorted(merged.items()):
+            requests = histogram['requests']
+            averages = ' '.join(
+                f'{key}={value / requests:.2f}' for key, value in sorted(histogram['totals'].items())
+            )
+            buckets = ' '.join(f'<={bound}:{count}' for bound, count in histogram['buckets_ms'] if count)
+            self.stdout.write(f'{route}: {requests} sampled, avg {averages}')
+            self.stdout.write(f'    latency ms {buckets}')
+
+        for alias, stats in sorted(pools.items()):
+            self.stdout.write(
+                f"pool {alias}: {stats['workers']} workers, {stats['in_use']}/{stats['size']} in use "
+                f"(saturation {stats['saturation']:.2f}), wait avg {stats['avg_wait_ms']:.2f}ms max {stats['max_wait_ms']:.2f}ms, "
+                f"{stats['timeouts']} timeouts, {stats['opened_last_minute']} opened last minute, {stats['reclaimed']} reclaimed"
+            )
@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ...services.subscription_service import SubscriptionExpiryService
+
+
+class Command(BaseCommand):
+    help = 'Deactivate (or renew) subscriptions whose end_date has passed, in bounded batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--renew', action='store_true', help='Start a new 30 day period instead of deactivating.')
+        parser.add_argument('--dry-run', action='store_true', help='Count expired subscriptions without changing them.')
+        parser.add_argument('--pause', type=float, default=0, help='Seconds to sleep between batches.')
+
+    def handle(self, *args, **options):
+        service = SubscriptionExpiryService(renew=options['renew'])
+        action = 'renew' if options['renew'] else 'deactivate'
+        if options['dry_run']:
+            action = f'would {action}'
+
+        total = 0
+        batches = 0
+        checkpoint = None
+        started = time.monotonic()
+        while True:
+            rows, checkpoint = service.run_batch(options['batch_size'], after=checkpoint, dry_run=options['dry_run'])
+            if checkpoint is None:
+                break
+            total += rows
+            batches += 1
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f'batch {batches}: {action} {rows} rows, {total} total, '
+                f'checkpoint end_date={checkpoint[0]} id={checkpoint[1]}, {total / elapsed if elapsed else 0:.0f} rows/s'
+            )
+            if options['pause']:
+                time.sleep(options['pause'])
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} {total} subscriptions in {batches} batches, {elapsed:.2f}s '
+            f'({total / elapsed if elapsed else 0:.0f} rows/s)'
+        ))
@@ -0,0 +1,38 @@
+import csv
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from appmanager.db.router import primary
+
+from ...services.user_service import UserService
+
+
+class Command(BaseCommand):
+    help = 'Bulk import users from a CSV or JSON-lines export of the old system.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='.csv (with a header row) or .jsonl file')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def read_rows(self, path):
+        with open(path, newline='') as source:
+            if path.endswith('.csv'):
+                yield from csv.DictReader(source)
+            elif path.endswith(('.jsonl', '.ndjson')):
+                for line in source:
+                    if line.strip():
+                        yield json.loads(line)
+            else:
+                raise CommandError('Expected a .csv or .jsonl file.')
+
+    def handle(self, *args, **options):
+        try:
+            # the existing-username check must see the batches just inserted
+            with primary():
+                stats = UserService.bulk_import(self.read_rows(options['path']), options['batch_size'])
+        except FileNotFoundError:
+            raise CommandError(f"{options['path']} does not exist.")
+        self.stdout.write(self.style.SUCCESS(
+            f"created {stats['created']}, skipped {stats['skipped']} existing, {stats['invalid']} invalid"
+        ))
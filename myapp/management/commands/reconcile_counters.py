@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ...services.counter_service import CounterService
+
+
+class Command(BaseCommand):
+    help = 'Recompute the denormalized app and subscription counters from the source rows.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Users recomputed per batch.')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        repaired = CounterService.reconcile(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'repaired {repaired} counters in {time.monotonic() - started:.2f}s'
+        ))
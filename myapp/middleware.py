@@ -0,0 +1,183 @@
+import hashlib
+import random
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.messages.middleware import MessageMiddleware
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.core.cache import caches
+from django.middleware.csrf import CsrfViewMiddleware
+
+from appmanager.db.router import use_primary
+
+from .profiling import RequestProfile, current_profile, registry
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class ProfilingMiddleware:
+    """
+    Profiles a PROFILING_SAMPLE_RATE fraction of requests: query count and
+    time, auth/service/serializer phases and response size. Sampled responses
+    carry a Server-Timing header and are aggregated per route name.
+    Async-capable: queries are attributed through the current_profile
+    ContextVar (see profiling.install_query_recorder), which follows the
+    request into sync_to_async threads.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = settings.PROFILING_SAMPLE_RATE
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def sampled(self):
+        return self.sample_rate and random.random() < self.sample_rate
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+
+        profile = RequestProfile()
+        token = current_profile.set(profile)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_profile.reset(token)
+        return self.report(request, response, profile)
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+
+        profile = RequestProfile()
+        token = current_profile.set(profile)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_profile.reset(token)
+        return self.report(request, response, profile)
+
+    def report(self, request, response, profile):
+        total_ms = profile.total_ms()
+        size = 0 if response.streaming else len(response.content)
+        timings = [('db', profile.query_ms, f'{profile.queries} queries')]
+        timings += [(name, elapsed, None) for name, elapsed in profile.phases.items()]
+        timings.append(('total', total_ms, None))
+        response['Server-Timing'] = ', '.join(
+            f'{name};dur={elapsed:.2f}' + (f';desc="{desc}"' if desc else '')
+            for name, elapsed, desc in timings
+        )
+
+        match = request.resolver_match
+        route = match.view_name if match else 'unresolved'
+        registry.observe(route, total_ms, {
+            'db_ms': profile.query_ms,
+            'queries': profile.queries,
+            'bytes': size,
+            **{f'{name}_ms': elapsed for name, elapsed in profile.phases.items()},
+            **profile.counts,
+        })
+        registry.flush(settings.PROFILING_DUMP_DIR, settings.PROFILING_FLUSH_SECONDS)
+        return response
+
+
+class ReplicaPinningMiddleware:
+    """
+    Read-your-writes for appmanager.db.router.ReplicaRouter. A request that
+    may write runs entirely on the primary, and the same client (told apart
+    by its Authorization header) keeps reading from the primary for
+    REPLICA_PIN_SECONDS afterwards, until the replicas have caught up.
+    Async-capable, so the async views keep running on the event loop.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = bool(settings.DATABASE_REPLICAS)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def pin_key(self, request):
+        authorization = request.headers.get('Authorization')
+        if not authorization:
+            return None
+        return 'replica_pin:' + hashlib.sha256(authorization.encode()).hexdigest()
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+
+        cache = caches[settings.REPLICA_PIN_CACHE]
+        key = self.pin_key(request)
+        writing = request.method not in SAFE_METHODS
+        token = use_primary.set(writing or (key is not None and cache.get(key) is not None))
+        try:
+            response = self.get_response(request)
+        finally:
+            use_primary.reset(token)
+        if writing and key is not None:
+            cache.set(key, True, settings.REPLICA_PIN_SECONDS)
+        return response
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+
+        cache = caches[settings.REPLICA_PIN_CACHE]
+        key = self.pin_key(request)
+        writing = request.method not in SAFE_METHODS
+        token = use_primary.set(writing or (key is not None and await cache.aget(key) is not None))
+        try:
+            response = await self.get_response(request)
+        finally:
+            use_primary.reset(token)
+        if writing and key is not None:
+            await cache.aset(key, True, settings.REPLICA_PIN_SECONDS)
+        return response
+
+
+class SiteOnlyMixin:
+    """
+    Skips a browser-session middleware for requests under API_PATH_PREFIX.
+    Those authenticate with a token inside the DRF view and never read the
+    session, CSRF cookie or messages, so they pass straight through while
+    admin/ keeps the full stack. Subclasses (rather than a wrapper around
+    the stock classes) keep the admin system checks satisfied.
+    """
+
+    def is_api(self, request):
+        return request.path_info.startswith(settings.API_PATH_PREFIX)
+
+    def __call__(self, request):
+        if self.is_api(request):
+            return self.get_response(request)
+        return super().__call__(request)
+
+
+class SiteSessionMiddleware(SiteOnlyMixin, SessionMiddleware):
+    pass
+
+
+class SiteCsrfViewMiddleware(SiteOnlyMixin, CsrfViewMiddleware):
+    def process_view(self, request, callback, callback_args, callback_kwargs):
+        # called by the handler directly, outside __call__
+        if self.is_api(request):
+            return None
+        return super().process_view(request, callback, callback_args, callback_kwargs)
+
+
+class SiteAuthenticationMiddleware(SiteOnlyMixin, AuthenticationMiddleware):
+    pass
+
+
+class SiteMessageMiddleware(SiteOnlyMixin, MessageMiddleware):
+    pass
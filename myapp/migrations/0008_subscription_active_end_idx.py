@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0007_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['active', 'end_date'], name='subscription_active_end_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:05
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0008_subscription_active_end_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='app_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='PlanSubscriptionCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('active', models.IntegerField(default=0)),
+                ('plan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='myapp.plan')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='plan_counts', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='plansubscriptioncount',
+            constraint=models.UniqueConstraint(fields=('user', 'plan'), name='unique_plan_count_for_user'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:05
+
+from django.db import migrations, models
+
+# authtoken's Token belongs to another app, so the index is added through
+# the schema editor rather than an AddIndex on a myapp model
+TOKEN_CREATED_INDEX = models.Index(fields=['created'], name='authtoken_token_created_idx')
+
+
+def add_index(apps, schema_editor):
+    schema_editor.add_index(apps.get_model('authtoken', 'Token'), TOKEN_CREATED_INDEX)
+
+
+def remove_index(apps, schema_editor):
+    schema_editor.remove_index(apps.get_model('authtoken', 'Token'), TOKEN_CREATED_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authtoken', '0003_tokenproxy'),
+        ('myapp', '0009_user_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_index, remove_index),
+    ]
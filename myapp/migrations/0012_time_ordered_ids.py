@@ -0,0 +1,94 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:40
+
+from django.db import migrations
+import myapp.fields
+import myapp.ids
+
+# every CHAR(32) uuid column on MySQL, foreign keys included, as
+# (table, column, nullable)
+UUID_COLUMNS = [
+    ('myapp_app', 'id', False),
+    ('myapp_plan', 'id', False),
+    ('myapp_subscription', 'id', False),
+    ('myapp_subscription', 'app_id', False),
+    ('myapp_subscription', 'plan_id', True),
+    ('myapp_plansubscriptioncount', 'plan_id', False),
+    ('myapp_change', 'object_id', False),
+]
+
+
+def convert(schema_editor, column_type, expression):
+    # other backends keep UUIDField's storage, only MySQL changes column type
+    connection = schema_editor.connection
+    if connection.vendor != 'mysql':
+        return
+    qn = schema_editor.quote_name
+    columns = {(table, column) for table, column, _ in UUID_COLUMNS}
+
+    # MySQL refuses to retype a column that a foreign key pairs with another
+    foreign_keys = []
+    with connection.cursor() as cursor:
+        for table in sorted({table for table, _ in columns}):
+            for name, info in connection.introspection.get_constraints(cursor, table).items():
+                if info['foreign_key'] and (table, info['columns'][0]) in columns:
+                    foreign_keys.append((table, name, info['columns'][0], *info['foreign_key']))
+    for table, name, *_ in foreign_keys:
+        schema_editor.execute(f'ALTER TABLE {qn(table)} DROP FOREIGN KEY {qn(name)}')
+
+    # existing ids keep their value: hex text <-> the same 16 bytes
+    for table, column, nullable in UUID_COLUMNS:
+        null = 'NULL' if nullable else 'NOT NULL'
+        schema_editor.execute(f'ALTER TABLE {qn(table)} MODIFY {qn(column)} varbinary(32) {null}')
+        schema_editor.execute(f'UPDATE {qn(table)} SET {qn(column)} = {expression.format(qn(column))}')
+        schema_editor.execute(f'ALTER TABLE {qn(table)} MODIFY {qn(column)} {column_type} {null}')
+
+    for table, name, column, target_table, target_column in foreign_keys:
+        schema_editor.execute(
+            f'ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(name)} FOREIGN KEY ({qn(column)}) '
+            f'REFERENCES {qn(target_table)} ({qn(target_column)})'
+        )
+
+
+def to_binary(apps, schema_editor):
+    convert(schema_editor, 'binary(16)', 'UNHEX({})')
+
+
+def to_char(apps, schema_editor):
+    convert(schema_editor, 'char(32)', 'LOWER(HEX({}))')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0011_change'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(to_binary, to_char),
+            ],
+            state_operations=[
+                migrations.AlterField(
+                    model_name='app',
+                    name='id',
+                    field=myapp.fields.BinaryUUIDField(default=myapp.ids.uuid7, editable=False, primary_key=True, serialize=False),
+                ),
+                migrations.AlterField(
+                    model_name='change',
+                    name='object_id',
+                    field=myapp.fields.BinaryUUIDField(),
+                ),
+                migrations.AlterField(
+                    model_name='plan',
+                    name='id',
+                    field=myapp.fields.BinaryUUIDField(default=myapp.ids.uuid7, editable=False, primary_key=True, serialize=False),
+                ),
+                migrations.AlterField(
+                    model_name='subscription',
+                    name='id',
+                    field=myapp.fields.BinaryUUIDField(default=myapp.ids.uuid7, editable=False, primary_key=True, serialize=False),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.30 on 2026-10-18 23:10
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.db.models.deletion
+
+
+def copy_app_user(apps, schema_editor):
+    App = apps.get_model('myapp', 'App')
+    Subscription = apps.get_model('myapp', 'Subscription')
+    Subscription.objects.update(user_id=Subquery(App.objects.filter(pk=OuterRef('app_id')).values('user_id')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('myapp', '0012_time_ordered_ids'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subscription',
+            name='user',
+            field=models.ForeignKey(db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='subscriptions', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(copy_app_user, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='subscription',
+            name='user',
+            field=models.ForeignKey(db_index=False, editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='subscriptions', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RemoveIndex(
+            model_name='subscription',
+            name='subscription_start_id_idx',
+        ),
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['user', 'start_date', 'id'], name='subscription_user_start_id_idx'),
+        ),
+    ]
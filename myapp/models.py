@@ -1,19 +1,23 @@
 from django.db import models
 from django.conf import settings
-import uuid
 from django.contrib.auth.models import AbstractUser
 from datetime import timedelta, date
+from .fields import BinaryUUIDField
+from .ids import uuid7
 
 # Create your models here.
 class User(AbstractUser):
     phone = models.CharField(max_length=20)
+    # maintained by CounterService, repaired by `manage.py reconcile_counters`
+    app_count = models.IntegerField(default=0)
     
 
 class App(models.Model):
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = BinaryUUIDField(primary_key=True, default=uuid7, editable=False)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='apps')
     name = models.CharField(max_length=255)
     description = models.TextField()
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         # A unique constraint on the 'name' and 'user' fields
@@ -26,7 +30,7 @@ class App(models.Model):
 
 
 class Plan(models.Model):
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = BinaryUUIDField(primary_key=True, default=uuid7, editable=False)
     FREE = 'free'
     STANDARD = 'standard'
     PRO = 'pro'
@@ -39,6 +43,7 @@ class Plan(models.Model):
 
     name = models.CharField(max_length=50, choices=PLAN_CHOICES, default=FREE)
     price = models.DecimalField(max_digits=5, decimal_places=2)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
@@ -46,15 +51,29 @@ class Plan(models.Model):
     
     
 class Subscription(models.Model):
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = BinaryUUIDField(primary_key=True, default=uuid7, editable=False)
     # app = models.ForeignKey(App, on_delete=models.CASCADE)
     app = models.ForeignKey(App, on_delete=models.CASCADE, related_name='subscriptions')
+    # copy of app.user_id, so a user's listing seeks one index range instead of joining apps;
+    # subscription_user_start_id_idx doubles as the foreign key's index
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='subscriptions', editable=False, db_index=False)
     plan = models.ForeignKey(Plan, on_delete=models.SET_NULL, null=True)
     active = models.BooleanField(default=True)
     start_date = models.DateField(auto_now_add=True)
     end_date = models.DateField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        # keyset pagination of a user's subscriptions walks (start_date, id) within the user
+        indexes = [
+            models.Index(fields=['user', 'start_date', 'id'], name='subscription_user_start_id_idx'),
+            # expiry sweeps scan active rows by end_date
+            models.Index(fields=['active', 'end_date'], name='subscription_active_end_idx'),
+        ]
     
     def save(self, *args, **kwargs):
+        if self.user_id is None:
+            self.user_id = self.app.user_id
         if not self.start_date: 
             self.start_date = date.today()  
         if not self.end_date:  # Only calculate end_date if it's not already set
@@ -64,4 +83,44 @@ class Subscription(models.Model):
     def __str__(self):
         return f"{self.app.name} - {self.plan.name}"
 
-    
\ No newline at end of file
+
+class PlanSubscriptionCount(models.Model):
+    # active subscriptions a user has on a plan, maintained by CounterService
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='plan_counts')
+    plan = models.ForeignKey(Plan, on_delete=models.CASCADE)
+    active = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'plan'], name='unique_plan_count_for_user')
+        ]
+
+
+
+class Change(models.Model):
+    """
+    Per-user change log behind GET changes. The auto-increment id is the
+    feed cursor; rows are appended by the services in the same transaction
+    as the write and trimmed by `manage.py compact_changes`.
+    """
+    APP = 'app'
+    SUBSCRIPTION = 'subscription'
+    KIND_CHOICES = [(APP, 'App'), (SUBSCRIPTION, 'Subscription')]
+
+    UPSERT = 'upsert'
+    DELETE = 'delete'
+    OP_CHOICES = [(UPSERT, 'Upsert'), (DELETE, 'Delete')]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='changes')
+    kind = models.CharField(max_length=12, choices=KIND_CHOICES)
+    object_id = BinaryUUIDField()
+    op = models.CharField(max_length=6, choices=OP_CHOICES, default=UPSERT)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # the feed reads one user's entries after a cursor
+            models.Index(fields=['user', 'id'], name='change_user_id_idx'),
+            # compaction looks for newer entries of the same object
+            models.Index(fields=['user', 'kind', 'object_id', 'id'], name='change_object_idx'),
+        ]
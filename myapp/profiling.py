@@ -0,0 +1,222 @@
+"""
+Sampled per-request profiling: DB, authentication, service and serializer
+timings (plus event counts such as response cache hits), aggregated into an
+in-process histogram per route.
+
+ProfilingMiddleware opens a RequestProfile for sampled requests; the
+`phase()` context manager and `profile_methods()` decorator add time to it
+and are a single ContextVar lookup when the request isn't sampled. Each
+worker periodically writes its histograms, along with its DB connection
+limiter stats, to PROFILING_DUMP_DIR, and once more when it exits, where the
+`dump_profiles` management command merges those written within
+PROFILING_DUMP_WINDOW_SECONDS.
+"""
+import asyncio
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from appmanager.db.pool import pool_stats
+
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, float('inf'))
+
+current_profile = ContextVar('current_profile', default=None)
+
+
+class RequestProfile:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.queries = 0
+        self.query_ms = 0.0
+        self.active = set()
+        self.counts = {}
+
+    def add(self, name, elapsed_ms):
+        self.phases[name] = self.phases.get(name, 0.0) + elapsed_ms
+
+    def total_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    def record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.query_ms += (time.perf_counter() - started) * 1000
+
+
+def record_query(execute, sql, params, many, context):
+    # on every connection: a single ContextVar lookup unless the request is sampled
+    profile = current_profile.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    return profile.record_query(execute, sql, params, many, context)
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """
+    connection_created receiver adding `record_query` to the connection.
+    The ContextVar follows a request into sync_to_async threads, so async
+    requests are attributed too. Put first, so execute_wrapper() blocks
+    popping their own wrapper off the end never remove it.
+    """
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+@contextmanager
+def phase(name):
+    profile = current_profile.get()
+    # nested calls in the same phase are already being timed by the outer one
+    if profile is None or name in profile.active:
+        yield
+        return
+    profile.active.add(name)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.active.discard(name)
+        profile.add(name, (time.perf_counter() - started) * 1000)
+
+
+def count(name):
+    # per-route event totals (e.g. cache hits) next to the phase timings
+    profile = current_profile.get()
+    if profile is not None:
+        profile.counts[name] = profile.counts.get(name, 0) + 1
+
+
+def profile_methods(phase_name, names=None):
+    """Class decorator timing the public (or the given) methods under `phase_name`."""
+    def wrap(method):
+        if asyncio.iscoroutinefunction(method):
+            @functools.wraps(method)
+            async def async_wrapper(*args, **kwargs):
+                with phase(phase_name):
+                    return await method(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            if current_profile.get() is None:
+                return method(*args, **kwargs)
+            with phase(phase_name):
+                return method(*args, **kwargs)
+        return wrapper
+
+    def decorate(cls):
+        for attr in names or [n for n in vars(cls) if not n.startswith('_')]:
+            raw = cls.__dict__.get(attr, getattr(cls, attr, None))
+            if isinstance(raw, staticmethod):
+                setattr(cls, attr, staticmethod(wrap(raw.__func__)))
+            elif callable(raw):
+                setattr(cls, attr, wrap(raw))
+        return cls
+    return decorate
+
+
+class RouteHistogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS_MS)
+        self.requests = 0
+        self.totals = {'total_ms': 0.0, 'db_ms': 0.0, 'queries': 0, 'bytes': 0}
+
+    def observe(self, total_ms, values):
+        self.requests += 1
+        for index, bound in enumerate(BUCKETS_MS):
+            if total_ms <= bound:
+                self.counts[index] += 1
+                break
+        self.totals['total_ms'] += total_ms
+        for key, value in values.items():
+            self.totals[key] = self.totals.get(key, 0) + value
+
+    def as_dict(self):
+        return {'requests': self.requests, 'buckets_ms': list(zip(BUCKETS_MS[:-1], self.counts)) + [['inf', self.counts[-1]]], 'totals': self.totals}
+
+
+class ProfileRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.routes = {}
+        self.last_flush = time.monotonic()
+        self._exit_directory = None
+
+    def observe(self, route, total_ms, values):
+        with self._lock:
+            self.routes.setdefault(route, RouteHistogram()).observe(total_ms, values)
+
+    def snapshot(self):
+        with self._lock:
+            return {route: histogram.as_dict() for route, histogram in self.routes.items()}
+
+    def flush(self, directory, interval):
+        if self._exit_directory is None:
+            # whatever was observed after the last flush is written on exit
+            self._exit_directory = directory
+            atexit.register(self.write, directory)
+        if time.monotonic() - self.last_flush < interval:
+            return
+        self.write(directory)
+
+    def write(self, directory):
+        self.last_flush = time.monotonic()
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f'profile-{os.getpid()}.json')
+        with open(f'{path}.tmp', 'w') as output:
+            json.dump({'written': time.time(), 'routes': self.snapshot(), 'pools': pool_stats()}, output)
+        os.replace(f'{path}.tmp', path)
+
+
+registry = ProfileRegistry()
+
+
+def read_dumps(directory, window=None):
+    """Worker dumps in `directory`, skipping those not written in the last `window` seconds (workers gone since)."""
+    cutoff = time.time() - window if window else None
+    for filename in sorted(os.listdir(directory)):
+        if filename.startswith('profile-') and filename.endswith('.json'):
+            with open(os.path.join(directory, filename)) as dump:
+                dump = json.load(dump)
+            if cutoff is None or dump['written'] >= cutoff:
+                yield dump
+
+
+def merge_dumps(directory, window=None):
+    """Merge every recent worker dump in `directory` into one {route: histogram} dict."""
+    merged = {}
+    for dump in read_dumps(directory, window):
+        for route, histogram in dump['routes'].items():
+            target = merged.setdefault(route, {'requests': 0, 'buckets_ms': [[bound, 0] for bound, _ in histogram['buckets_ms']], 'totals': {}})
+            target['requests'] += histogram['requests']
+            for bucket, (_, count) in zip(target['buckets_ms'], histogram['buckets_ms']):
+                bucket[1] += count
+            for key, value in histogram['totals'].items():
+                target['totals'][key] = target['totals'].get(key, 0) + value
+    return merged
+
+
+def merge_pools(directory, window=None):
+    """Every recent worker's ConnectionLimiter stats summed per DB alias (waits averaged over checkouts)."""
+    merged = {}
+    for dump in read_dumps(directory, window):
+        for alias, stats in dump['pools'].items():
+            target = merged.setdefault(alias, {'workers': 0, 'size': 0, 'in_use': 0, 'checkouts': 0, 'timeouts': 0,
+                                               'opened_last_minute': 0, 'reclaimed': 0, 'total_wait_ms': 0.0, 'max_wait_ms': 0.0})
+            target['workers'] += 1
+            for key in ('size', 'in_use', 'checkouts', 'timeouts', 'opened_last_minute', 'reclaimed'):
+                target[key] += stats[key]
+            target['total_wait_ms'] += stats['avg_wait_ms'] * stats['checkouts']
+            target['max_wait_ms'] = max(target['max_wait_ms'], stats['max_wait_ms'])
+    for stats in merged.values():
+        stats['saturation'] = stats['in_use'] / stats['size'] if stats['size'] else 0.0
+        stats['avg_wait_ms'] = stats.pop('total_wait_ms') / stats['checkouts'] if stats['checkouts'] else 0.0
+    return merged
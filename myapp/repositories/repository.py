@@ -14,6 +14,14 @@ class Repository:
     def filter_objects(self, **filters):
         return self.model.objects.filter(**filters)
 
+    def delete_objects(self, **filters):
+        # returns how many rows of this model were deleted. Django's collector
+        # issues a single DELETE when the model has no delete signal receivers
+        # and nothing to cascade to, otherwise it loads the rows first so
+        # cascades and post_delete receivers run
+        deleted, per_model = self.model.objects.filter(**filters).delete()
+        return per_model.get(self.model._meta.label, 0)
+
     def get_object(self, **filters):
         return self.model.objects.get(**filters)
     
@@ -28,3 +36,17 @@ class Repository:
             return model.objects.get(**filters)
         except model.DoesNotExist:
             return None
+
+    # async ORM variants used by the async read endpoints
+    async def aget_object(self, **filters):
+        return await self.model.objects.aget(**filters)
+
+    async def aget_object_or_none(self, model, **filters):
+        try:
+            return await model.objects.aget(**filters)
+        except model.DoesNotExist:
+            return None
+
+    async def alist(self, queryset):
+        return [instance async for instance in queryset]
+
@@ -0,0 +1,178 @@
+"""
+Per-user cache of the hot GET responses (user apps, app, user
+subscriptions, profile).
+
+Entries are keyed by (user, user generation, global generation, host,
+path, query). Every write to a user's apps or subscriptions goes through
+ChangeFeedService, which bumps that user's generation; a saved or deleted
+App and a saved User bump it too, and a saved Plan bumps the global one. Reads after a bump
+build a new key, so invalidation is a single increment and old entries age
+out. Subscriptions edited outside the API (admin) show up once their
+entries expire after RESPONSE_CACHE_SECONDS.
+
+Bodies live in a size-bounded LRU in each worker's memory, or in the
+RESPONSE_CACHE alias when one is configured (its own eviction then
+applies). Generations live in RESPONSE_CACHE_GENERATIONS, which must be
+shared by all workers for a bump in one to reach the others; startup
+refuses a per-process cache there (MyappConfig.check_shared_caches).
+"""
+import functools
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+from rest_framework.response import Response
+
+from .profiling import count
+
+GLOBAL_GENERATION_KEY = 'response_generation:*'
+CACHED_HEADERS = ('ETag', 'Last-Modified')
+
+
+def generation_key(user_id):
+    return f'response_generation:{user_id}'
+
+
+class LocalLRU:
+    """Thread-safe in-process store holding at most `max_entries`, least recently used evicted first."""
+
+    def __init__(self, max_entries):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.max_entries = max_entries
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + timeout, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class ResponseCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.configure()
+
+    def configure(self, cache_alias=None, generations_alias='default', max_entries=10000, timeout=60):
+        self.timeout = timeout
+        self.store = caches[cache_alias] if cache_alias else LocalLRU(max_entries)
+        self.generations = caches[generations_alias]
+        self.hits = self.misses = 0
+
+    def stats(self):
+        """This worker's hit/miss counts (and LRU size and evictions when bodies are kept in memory)."""
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        stats = {'hits': hits, 'misses': misses, 'hit_rate': round(hits / (hits + misses), 4) if hits + misses else None}
+        if isinstance(self.store, LocalLRU):
+            stats.update(entries=len(self.store), max_entries=self.store.max_entries, evictions=self.store.evictions)
+        return stats
+
+    def invalidate(self, user_ids):
+        self._bump_on_commit([generation_key(user_id) for user_id in set(user_ids)])
+
+    def invalidate_all(self):
+        self._bump_on_commit([GLOBAL_GENERATION_KEY])
+
+    def _bump_on_commit(self, keys):
+        # now, so this transaction's own reads miss, and again after commit,
+        # since another request may have cached the pre-commit rows meanwhile
+        self._bump(keys)
+        transaction.on_commit(lambda: self._bump(keys))
+
+    def _bump(self, keys):
+        for key in keys:
+            try:
+                self.generations.incr(key)
+            except ValueError:
+                self._start(key)
+
+    def _start(self, key):
+        # never from 0: an evicted counter restarts above every value it had
+        self.generations.add(key, time.time_ns(), None)
+
+    def key(self, request):
+        keys = [generation_key(request.user.pk), GLOBAL_GENERATION_KEY]
+        found = self.generations.get_many(keys)
+        missing = [key for key in keys if key not in found]
+        if missing:
+            for key in missing:
+                self._start(key)
+            found.update(self.generations.get_many(missing))
+        query = sorted(request.GET.lists())
+        digest = hashlib.sha1(f'{request.get_host()}|{request.path}|{query}'.encode(), usedforsecurity=False).hexdigest()
+        return f'response:{request.user.pk}:{found.get(keys[0])}:{found.get(keys[1])}:{digest}'
+
+    def respond(self, request, build_response):
+        """Serve `request` from the cache, or call `build_response` and keep its 200 Response."""
+        if not self.timeout or request.method != 'GET':
+            return build_response()
+        key = self.key(request)
+        entry = self.store.get(key)
+        if entry is not None:
+            self._count('hit')
+            return self._replay(request, *entry)
+
+        self._count('miss')
+        response = build_response()
+        if isinstance(response, Response) and response.status_code == 200:
+            headers = {name: response[name] for name in CACHED_HEADERS if response.has_header(name)}
+            self.store.set(key, (response.data, headers), self.timeout)
+        return response
+
+    def _replay(self, request, data, headers):
+        if 'ETag' in headers:
+            not_modified = get_conditional_response(
+                request, etag=headers['ETag'], last_modified=parse_http_date_safe(headers.get('Last-Modified', '')),
+            )
+            if not_modified is not None:
+                for name, value in headers.items():
+                    not_modified[name] = value
+                return not_modified
+        return Response(data, headers=headers)
+
+    def _count(self, outcome):
+        with self._lock:
+            if outcome == 'hit':
+                self.hits += 1
+            else:
+                self.misses += 1
+        count(f'response_cache_{outcome}')
+
+
+response_cache = ResponseCache()
+
+
+def cached_per_user(view):
+    """Cache an authenticated function view's GET responses in `response_cache`."""
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        return response_cache.respond(request, lambda: view(request, *args, **kwargs))
+    return wrapper
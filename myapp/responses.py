@@ -0,0 +1,7 @@
+from django.http import HttpResponse
+from rest_framework.renderers import JSONRenderer
+
+
+def json_response(data, status=200):
+    # same bytes DRF's JSONRenderer produces, for views that run outside DRF
+    return HttpResponse(JSONRenderer().render(data), status=status, content_type='application/json')
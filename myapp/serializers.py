@@ -3,16 +3,23 @@ from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
 from django.contrib.auth.hashers import make_password
-from .models import App, Subscription, Plan
+from .models import App, Change, Subscription, Plan
 from datetime import timedelta
+from collections import Counter
 from django.utils import timezone
+from django.db import transaction
 
 from rest_framework.authtoken.models import Token
-from .authentication import token_expire_handler, expires_in, is_token_expired
-from django.contrib.auth import authenticate, login
+from .authentication import expires_in, issue_token
+from .services.plan_catalogue import plan_catalogue
+from .profiling import profile_methods
+from .services.counter_service import CounterService
+from .services.change_service import ChangeFeedService
+from django.contrib.auth import authenticate
 
 User = get_user_model()
 
+@profile_methods('serializer', names=['to_representation'])
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
@@ -22,10 +29,11 @@ class UserSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         validated_data['password'] = make_password(validated_data.get('password'))
         validated_data['is_active'] = True
-        user = super().create(validated_data)
-        token, _ = Token.objects.get_or_create(user=user)
-        is_expired, token_key = token_expire_handler(token)
-        user.token = token_key
+        # a brand new user has no token yet, so both rows are plain inserts
+        with transaction.atomic():
+            user = super().create(validated_data)
+            token = Token.objects.create(user=user)
+        user.token = token.key
         user.expires_in = expires_in(token)
         user.message = "User Registered Successfully"
         return user
@@ -80,19 +88,15 @@ class LoginSerializer(serializers.Serializer):
             raise serializers.ValidationError("Incorrect Login credentials")
 
         # after successful authentication
-        token, _ = Token.objects.get_or_create(user=user)
-        if is_token_expired(token.key):
-            token.delete()
-            token = Token.objects.create(user=user)
-
-        is_expired, token_key = token_expire_handler(token)
-        user.token = token_key
+        token = issue_token(user)
+        user.token = token.key
         user.expires_in = expires_in(token)
         user.message = "Login Successful"
                
         return user
     
 
+@profile_methods('serializer', names=['to_representation'])
 class AuthResponseSerializer(serializers.ModelSerializer):
     token = serializers.CharField()
     token_expires_in = serializers.SerializerMethodField()
@@ -113,18 +117,31 @@ class AuthResponseSerializer(serializers.ModelSerializer):
         return user.expires_in  
  
  
+@profile_methods('serializer', names=['to_representation'])
 class AppSerializer(serializers.ModelSerializer):
     class Meta:
         model = App
         fields = ['id', 'user', 'name', 'description']
         read_only_fields = ['user']
 
+@profile_methods('serializer', names=['to_representation'])
 class AppUpdateSerializer(serializers.ModelSerializer):
     class Meta:
         model = App
         fields = ['name', 'description']  
         read_only_fields = ['user']
+
+    def update(self, instance, validated_data):
+        changed = [field for field, value in validated_data.items() if getattr(instance, field) != value]
+        for field in changed:
+            setattr(instance, field, validated_data[field])
+        if changed:
+            with transaction.atomic():
+                instance.save(update_fields=changed + ['updated_at'])
+                ChangeFeedService.record([(instance.user_id, Change.APP, instance.pk, Change.UPSERT)])
+        return instance
         
+@profile_methods('serializer', names=['to_representation'])
 class SubscriptionSerializer(serializers.ModelSerializer):
     app = serializers.CharField(source='app.name', read_only=True)
     plan = serializers.CharField(source='plan.name', read_only=True)
@@ -135,15 +152,32 @@ class SubscriptionSerializer(serializers.ModelSerializer):
         fields = ['id', 'app', 'plan', 'plan_price', 'active', 'start_date', 'end_date']
 
 
+class CataloguePlanField(serializers.PrimaryKeyRelatedField):
+    # resolves plan ids from the in-memory plan catalogue instead of the DB
+    def to_internal_value(self, data):
+        try:
+            plan = plan_catalogue.get(data)
+        except (TypeError, ValueError, AttributeError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if plan is None:
+            self.fail('does_not_exist', pk_value=data)
+        return plan
+
+
+@profile_methods('serializer', names=['to_representation'])
 class SubscriptionUpdateSerializer(serializers.ModelSerializer):
-    plan = serializers.PrimaryKeyRelatedField(queryset=Plan.objects.all())
+    plan = CataloguePlanField(queryset=Plan.objects.all())
     plan_name = serializers.CharField(source='plan.name', read_only=True)
 
     class Meta:
         model = Subscription
         fields = ['plan','plan_name', 'active', 'end_date'] 
 
+    TRACKED_FIELDS = ('plan_id', 'active', 'start_date', 'end_date')
+
     def update(self, instance, validated_data):
+        before = {field: getattr(instance, field) for field in self.TRACKED_FIELDS}
+        counted_before = (instance.plan_id, instance.active)
         if 'plan' in validated_data and validated_data['plan'] != instance.plan:
             # Update the start_date to today
             instance.start_date = timezone.now().date()
@@ -153,14 +187,40 @@ class SubscriptionUpdateSerializer(serializers.ModelSerializer):
         instance.plan = validated_data.get('plan', instance.plan)
         instance.active = validated_data.get('active', instance.active)
         instance.end_date = validated_data.get('end_date', instance.end_date)
-        instance.save()
+        changed = [field for field in self.TRACKED_FIELDS if getattr(instance, field) != before[field]]
+        if not changed:
+            return instance
+        with transaction.atomic():
+            instance.save(update_fields=[field.removesuffix('_id') for field in changed] + ['updated_at'])
+            ChangeFeedService.record([(instance.app.user_id, Change.SUBSCRIPTION, instance.pk, Change.UPSERT)])
+            counted_after = (instance.plan_id, instance.active)
+            if counted_after != counted_before:
+                deltas = Counter()
+                user_id = instance.app.user_id
+                if counted_before[1]:
+                    deltas[(user_id, counted_before[0])] -= 1
+                if counted_after[1]:
+                    deltas[(user_id, counted_after[0])] += 1
+                CounterService.adjust_plans(deltas)
         return instance
     
 
+@profile_methods('serializer', names=['to_representation'])
 class PlanSerializer(serializers.ModelSerializer):
     class Meta:
         model = Plan
         fields = ['id', 'name', 'price']
         read_only_fields = ['name', 'price']
-        
-    
\ No newline at end of file
+
+
+class UserProfileSerializer(UserSerializer):
+    app_count = serializers.IntegerField(read_only=True)
+    active_subscriptions = serializers.SerializerMethodField()
+
+    class Meta(UserSerializer.Meta):
+        fields = UserSerializer.Meta.fields + ('app_count', 'active_subscriptions')
+
+    def get_active_subscriptions(self, user):
+        counts = CounterService.profile(user)
+        return {plan.name: counts.get(plan.pk, 0) for plan in plan_catalogue.all()}
+
@@ -1,14 +1,33 @@
+import json
+import uuid
+from collections import Counter
 from ..repositories.repository import Repository
-from ..models import App
-from ..serializers import  AppSerializer, AppUpdateSerializer
+from ..profiling import profile_methods
+from ..models import App, Change, Subscription
+from ..serializers import  AppSerializer, AppUpdateSerializer, PlanSerializer
+from ..pagination import KeysetPagination
+from ..conditional import conditional_response
+from ..responses import json_response
+from ..rows import APP_ROWS, EMBEDDED_SUBSCRIPTION_ROWS
+from .subscription_service import create_free_plan_subscriptions
+from .counter_service import CounterService
+from .change_service import ChangeFeedService
+from .plan_catalogue import plan_catalogue
 from rest_framework.response import Response
 from rest_framework import status
-from django.db import IntegrityError
-from django.http import Http404
+from django.db import IntegrityError, transaction
+from django.db.models.functions import Lower
+from django.http import Http404, StreamingHttpResponse
 from django.core.exceptions import PermissionDenied
+from django.conf import settings
 
+@profile_methods('service')
 class AppService:
-    
+    STREAM_CHUNK_SIZE = 500
+    BULK_CREATE_LIMIT = 1000
+    BULK_DELETE_LIMIT = 1000
+    INCLUDE_OPTIONS = ('subscription', 'plan')
+
     def __init__(self):
         self.repository = Repository(App)
 
@@ -18,38 +37,231 @@ class AppService:
             validated_data = serializer.validated_data
             validated_data['user'] = user
             try:
-                app = self.repository.create(validated_data)
+                with transaction.atomic():
+                    if not CounterService.reserve_apps(user, 1, settings.MAX_APPS_PER_USER):
+                        return Response({'error': f'App limit of {settings.MAX_APPS_PER_USER} reached.'}, status=status.HTTP_400_BAD_REQUEST)
+                    app = self.repository.create(validated_data)
+                    # the post_save signal puts the app on the Free plan (and logs that subscription)
+                    CounterService.adjust_plans({(user.pk, plan_catalogue.get_by_name("Free").pk): 1})
+                    ChangeFeedService.record([(user.pk, Change.APP, app.pk, Change.UPSERT)])
                 return Response(AppSerializer(app).data, status=status.HTTP_201_CREATED)
             except IntegrityError:
                 return Response({'error': f'{validated_data["name"]} already exists under this user.'}, status=status.HTTP_400_BAD_REQUEST)
         else:
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
      
-    def get_apps_for_user(self, user):
+    def bulk_create_apps(self, data, user):
+        if not isinstance(data, list) or not data:
+            return Response({'error': 'Expected a non-empty list of apps.'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(data) > self.BULK_CREATE_LIMIT:
+            return Response({'error': f'At most {self.BULK_CREATE_LIMIT} apps can be created at once.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        errors = []
+        candidates = []
+        for index, item in enumerate(data):
+            serializer = AppSerializer(data=item)
+            if serializer.is_valid():
+                candidates.append((index, serializer.validated_data))
+            else:
+                errors.append({'index': index, 'errors': serializer.errors})
+
+        # two passes at most: an IntegrityError means apps were created
+        # concurrently, whose names the second pass reports as taken
+        for attempt in range(2):
+            duplicates, apps = self.split_taken_names(user, candidates)
+            if not apps:
+                break
+            try:
+                with transaction.atomic():
+                    if not CounterService.reserve_apps(user, len(apps), settings.MAX_APPS_PER_USER):
+                        return Response({'error': f'Creating {len(apps)} apps would exceed the limit of {settings.MAX_APPS_PER_USER}.'}, status=status.HTTP_400_BAD_REQUEST)
+                    App.objects.bulk_create(apps)
+                    ChangeFeedService.record([(user.pk, Change.APP, app.pk, Change.UPSERT) for app in apps])
+                    # bulk_create skips post_save, so the free plan is attached here
+                    create_free_plan_subscriptions(apps)
+                    CounterService.adjust_plans({(user.pk, plan_catalogue.get_by_name("Free").pk): len(apps)})
+                break
+            except IntegrityError:
+                if attempt:
+                    return Response({'error': 'Apps were created concurrently under this user, retry the request.'}, status=status.HTTP_409_CONFLICT)
+
+        errors.extend(duplicates)
+        errors.sort(key=lambda error: error['index'])
+        response_data = {'created': AppSerializer(apps, many=True).data, 'errors': errors}
+        return Response(response_data, status=status.HTTP_201_CREATED if apps else status.HTTP_400_BAD_REQUEST)
+     
+    def split_taken_names(self, user, candidates):
+        """
+        Splits (index, validated_data) pairs into errors for names already
+        taken, under this user or earlier in the batch, and the Apps to
+        create. Names compare case-insensitively, as MySQL's collation does
+        for the (name, user) unique constraint.
+        """
+        names = {validated_data['name'].lower() for _, validated_data in candidates}
+        # one query for every name already taken under this user
+        taken = {name.casefold() for name in self.repository.filter_objects(user=user).annotate(
+            lower_name=Lower('name'),
+        ).filter(lower_name__in=names).values_list('name', flat=True)}
+
+        errors, apps = [], []
+        for index, validated_data in candidates:
+            name = validated_data['name'].casefold()
+            if name in taken:
+                errors.append({'index': index, 'errors': {'error': f'{validated_data["name"]} already exists under this user.'}})
+                continue
+            taken.add(name)
+            apps.append(App(user=user, **validated_data))
+        return errors, apps
+
+    def filter_apps(self, user, params):
         apps = self.repository.filter_objects(user=user)
-        if apps.exists():
-            serializer = AppSerializer(apps, many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+        # prefix search stays on the (name, user) unique index: on MySQL istartswith is a plain
+        # LIKE under the column's case-insensitive collation (startswith would be LIKE BINARY)
+        name = params.get('name')
+        if name:
+            apps = apps.filter(name__istartswith=name)
+        return apps
+
+    def parse_include(self, params):
+        """
+        Returns (include, errors) for `?include=subscription,plan`. The plan
+        is embedded inside the subscription, so `plan` implies `subscription`.
+        """
+        include = {value.strip() for value in params.get('include', '').split(',') if value.strip()}
+        unknown = include - set(self.INCLUDE_OPTIONS)
+        if unknown:
+            return None, {'include': f"Unknown value {', '.join(sorted(unknown))}, expected any of {', '.join(self.INCLUDE_OPTIONS)}."}
+        if 'plan' in include:
+            include.add('subscription')
+        return include, None
+
+    def embedded_subscription(self, subscription, plans=None):
+        """
+        `subscription` is a .values() row or an instance. With `plans` (plan
+        id -> serialized plan) the plan is embedded instead of its id.
+        """
+        if subscription is None:
+            return None
+        if isinstance(subscription, dict):
+            data, plan_id = EMBEDDED_SUBSCRIPTION_ROWS.row(subscription), subscription['plan_id']
         else:
+            data, plan_id = EMBEDDED_SUBSCRIPTION_ROWS.from_instance(subscription), subscription.plan_id
+        if plans is not None and plan_id is not None:
+            data['plan'] = plans.get(plan_id)
+        return data
+
+    def serialized_plans(self, plans, include):
+        if 'plan' not in include:
+            return None
+        return {plan.pk: PlanSerializer(plan).data for plan in plans if plan is not None}
+
+    def subscriptions_for_page(self, page):
+        # one query for the whole page, ordered so an app's newest subscription comes last
+        app_ids = [row['id'] for row in page]
+        subscriptions = Repository(Subscription).filter_objects(app_id__in=app_ids).order_by('start_date', 'id')
+        return subscriptions.values('app_id', *EMBEDDED_SUBSCRIPTION_ROWS.columns)
+
+    def embed_subscriptions(self, page, rows, subscriptions, plans):
+        current = {subscription['app_id']: subscription for subscription in subscriptions}
+        for values, row in zip(page, rows):
+            row['subscription'] = self.embedded_subscription(current.get(values['id']), plans)
+        return rows
+
+    def get_apps_for_user(self, user, request):
+        include, errors = self.parse_include(request.GET)
+        if errors:
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+        apps = self.filter_apps(user, request.GET)
+
+        if request.GET.get('stream') == 'ndjson':
+            if include:
+                return Response({'include': 'Not supported when streaming.'}, status=status.HTTP_400_BAD_REQUEST)
+            return self.stream_apps(apps.order_by('name', 'id'))
+
+        paginator = KeysetPagination(ordering=('name', 'id'))
+        page = paginator.paginate_queryset(APP_ROWS.values(apps), request)
+        if not page and paginator.cursor is None:
             return Response({'message': 'No apps created'}, status=status.HTTP_404_NOT_FOUND)
+        rows = APP_ROWS.rows(page)
+        if include:
+            plans = self.serialized_plans(plan_catalogue.all(), include)
+            rows = self.embed_subscriptions(page, rows, self.subscriptions_for_page(page), plans)
+        return paginator.get_paginated_response(rows)
+
+    def stream_apps(self, apps):
+        # one JSON object per line, rows are fetched in chunks and never held all at once
+        def rows():
+            for row in APP_ROWS.values(apps).iterator(chunk_size=self.STREAM_CHUNK_SIZE):
+                yield json.dumps(APP_ROWS.row(row)) + '\n'
+        return StreamingHttpResponse(rows(), content_type='application/x-ndjson')
     
-    def get_app(self, user, app_id):
-        try:
-            app = self.repository.get_object(id=app_id, user=user)
-            serializer = AppSerializer(app) 
-            return serializer.data
-        except App.DoesNotExist:
-            raise Http404("App not found or does not belong to this user")
+    def current_subscription(self, user, app_id):
+        # the app comes along in the same joined query
+        return Repository(Subscription).filter_objects(app_id=app_id, user=user).select_related('app').order_by('-start_date', '-id')
+
+    def app_with_subscription(self, request, include, app, subscription, plan, render):
+        def build_response():
+            data = AppSerializer(app).data
+            data['subscription'] = self.embedded_subscription(subscription, self.serialized_plans([plan], include))
+            return render(data)
+        return conditional_response(request, [app, subscription, plan], build_response, variant=','.join(sorted(include)))
+
+    def get_app(self, user, app_id, request):
+        include, errors = self.parse_include(request.GET)
+        if errors:
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+        subscription = self.current_subscription(user, app_id).first() if include else None
+        if subscription is not None:
+            app = subscription.app
+        else:
+            try:
+                app = self.repository.get_object(id=app_id, user=user)
+            except App.DoesNotExist:
+                raise Http404("App not found or does not belong to this user")
+        if include:
+            plan = plan_catalogue.get(subscription.plan_id) if subscription and subscription.plan_id and 'plan' in include else None
+            return self.app_with_subscription(request, include, app, subscription, plan, Response)
+        return conditional_response(request, [app], lambda: Response(AppSerializer(app).data))
+
+    async def aget_apps_for_user(self, user, request):
+        include, errors = self.parse_include(request.GET)
+        if errors:
+            return json_response(errors, status=status.HTTP_400_BAD_REQUEST)
+        paginator = KeysetPagination(ordering=('name', 'id'))
+        page = await paginator.apaginate_queryset(APP_ROWS.values(self.filter_apps(user, request.GET)), request)
+        if not page and paginator.cursor is None:
+            return json_response({'message': 'No apps created'}, status=status.HTTP_404_NOT_FOUND)
+        rows = APP_ROWS.rows(page)
+        if include:
+            plans = self.serialized_plans(await plan_catalogue.aall(), include)
+            subscriptions = await self.repository.alist(self.subscriptions_for_page(page))
+            rows = self.embed_subscriptions(page, rows, subscriptions, plans)
+        return json_response(paginator.get_paginated_data(rows))
+
+    async def aget_app(self, user, app_id, request):
+        include, errors = self.parse_include(request.GET)
+        if errors:
+            return json_response(errors, status=status.HTTP_400_BAD_REQUEST)
+        subscription = await self.current_subscription(user, app_id).afirst() if include else None
+        if subscription is not None:
+            app = subscription.app
+        else:
+            try:
+                app = await self.repository.aget_object(id=app_id, user=user)
+            except App.DoesNotExist:
+                raise Http404("App not found or does not belong to this user")
+        if include:
+            plan = await plan_catalogue.aget(subscription.plan_id) if subscription and subscription.plan_id and 'plan' in include else None
+            return self.app_with_subscription(request, include, app, subscription, plan, json_response)
+        return conditional_response(request, [app], lambda: json_response(AppSerializer(app).data))
     
     def update_app(self, user, app_id, update_data):
-        try:
-            app = self.repository.get_object(pk=app_id)
-        except App.DoesNotExist:
+        app = self.repository.filter_objects(pk=app_id, user=user).first()
+        if app is None:
+            if self.repository.filter_objects(pk=app_id).exists():
+                raise PermissionDenied('Permission denied. This app does not belong to this user.')
             raise Http404('App not found.')
 
-        if app.user != user:
-            raise PermissionDenied('Permission denied. This app does not belong to this user.')
-
         serializer = AppUpdateSerializer(app, data=update_data, partial=True)
         if serializer.is_valid(raise_exception=True):
             try:
@@ -66,12 +278,48 @@ class AppService:
     
     
     def delete_app_and_subscriptions(self, user, app_id):
-            app = self.repository.get_object_or_fail(id=app_id, user=user)
-            if app is None:
+        # the subscriptions are deleted by the app's cascade, read first for the counters and change log
+        with transaction.atomic():
+            subscriptions = Repository(Subscription)
+            rows = list(subscriptions.filter_objects(app_id=app_id, user=user).values_list('id', 'plan_id', 'active'))
+            deleted = self.repository.delete_objects(id=app_id, user=user)
+            if not deleted:
                 return "App not found.", 404
+            CounterService.adjust_apps(user.pk, -deleted)
+            CounterService.adjust_plans(CounterService.negate(self.active_counts(user, rows)))
+            ChangeFeedService.record(
+                [(user.pk, Change.SUBSCRIPTION, pk, Change.DELETE) for pk, _, _ in rows]
+                + [(user.pk, Change.APP, app_id, Change.DELETE)]
+            )
+        return "App and corresponding subscriptions deleted successfully.", 204
 
-            if app.user != user:
-                return "Permission denied.", 403
+    def active_counts(self, user, rows):
+        # {(user_id, plan_id): n} over (id, plan_id, active) subscription rows
+        return Counter((user.pk, plan_id) for _, plan_id, active in rows if active)
+
+    def bulk_delete_apps(self, user, data):
+        app_ids = data.get('ids') if isinstance(data, dict) else None
+        if not isinstance(app_ids, list) or not app_ids:
+            return {'error': 'Expected a non-empty list of app ids.'}, status.HTTP_400_BAD_REQUEST
+        if len(app_ids) > self.BULK_DELETE_LIMIT:
+            return {'error': f'At most {self.BULK_DELETE_LIMIT} apps can be deleted at once.'}, status.HTTP_400_BAD_REQUEST
+        try:
+            app_ids = [uuid.UUID(str(app_id)) for app_id in app_ids]
+        except ValueError:
+            return {'error': 'App ids must be valid UUIDs.'}, status.HTTP_400_BAD_REQUEST
 
-            app.delete()
-            return "App and corresponding subscriptions deleted successfully.", 204
+        with transaction.atomic():
+            # only the caller's apps, so the change log never names someone else's ids
+            app_ids = list(self.repository.filter_objects(id__in=app_ids, user=user).values_list('id', flat=True))
+            subscriptions = Repository(Subscription)
+            rows = list(subscriptions.filter_objects(app_id__in=app_ids).values_list('id', 'plan_id', 'active'))
+            # the subscriptions go with the apps' cascade
+            subscriptions_deleted = len(rows)
+            apps_deleted = self.repository.delete_objects(id__in=app_ids, user=user)
+            CounterService.adjust_apps(user.pk, -apps_deleted)
+            CounterService.adjust_plans(CounterService.negate(self.active_counts(user, rows)))
+            ChangeFeedService.record(
+                [(user.pk, Change.SUBSCRIPTION, pk, Change.DELETE) for pk, _, _ in rows]
+                + [(user.pk, Change.APP, pk, Change.DELETE) for pk in app_ids]
+            )
+        return {'apps_deleted': apps_deleted, 'subscriptions_deleted': subscriptions_deleted}, status.HTTP_200_OK
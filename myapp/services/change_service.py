@@ -0,0 +1,178 @@
+import base64
+import binascii
+import json
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from ..models import App, Change, Subscription
+from ..repositories.repository import Repository
+from ..response_cache import response_cache
+from ..rows import APP_ROWS, SUBSCRIPTION_ROWS
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class ExpiredCursor(Exception):
+    pass
+
+
+class ChangeFeedService:
+    """
+    Incremental sync: clients take a cursor, download user-apps and
+    subscriptions once, then poll GET changes?cursor= for what changed.
+
+    A cursor holds the last log id the client has seen and a timestamp no
+    later than the creation of any entry after it: the time it was issued
+    when it reached the end of the log, otherwise the creation time of the
+    last entry it covers. Entries older than CHANGE_FEED_RETENTION_DAYS are
+    compacted away, so a cursor stamped before that horizon is refused and
+    the client has to download everything again.
+
+    Ids are assigned before commit, so on their own a slow transaction
+    could commit a lower id behind a cursor that has already moved past it.
+    `record` therefore locks the users' rows before inserting: writers of
+    one user's entries queue up behind each other's commit, and within one
+    user's feed id order is commit order. Whatever id a reader sees, every
+    lower id of that user is already committed.
+
+    Every write to a user's apps or subscriptions is logged here, so the
+    writers also invalidate the users' cached responses.
+    """
+    MAX_LIMIT = 1000
+    DEFAULT_LIMIT = 100
+
+    @staticmethod
+    def record(entries):
+        """Log (user_id, kind, object_id, op) tuples, in one INSERT."""
+        changes = [Change(user_id=user_id, kind=kind, object_id=pk, op=op) for user_id, kind, pk, op in entries]
+        if not changes:
+            return
+        user_ids = sorted({change.user_id for change in changes})
+        with transaction.atomic(savepoint=False):
+            # held until the outermost transaction commits, in pk order so writers can't deadlock here
+            list(get_user_model().objects.select_for_update().filter(pk__in=user_ids).order_by('pk').values_list('pk', flat=True))
+            Change.objects.bulk_create(changes)
+        response_cache.invalidate(change.user_id for change in changes)
+
+    @staticmethod
+    def encode_cursor(last_id, stamp=None):
+        stamp = int(time.time() if stamp is None else stamp)
+        return base64.urlsafe_b64encode(json.dumps([last_id, stamp]).encode('ascii')).decode('ascii')
+
+    @staticmethod
+    def decode_cursor(encoded):
+        try:
+            last_id, stamp = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            last_id, stamp = int(last_id), int(stamp)
+        except (TypeError, ValueError, binascii.Error):
+            raise InvalidCursor('Invalid cursor.')
+        # an hour short of the retention, so compaction never reaches entries right after a valid cursor
+        max_age = timedelta(days=settings.CHANGE_FEED_RETENTION_DAYS) - timedelta(hours=1)
+        if stamp < time.time() - max_age.total_seconds():
+            raise ExpiredCursor('Cursor is older than the change log retention, download everything again.')
+        return last_id
+
+    @staticmethod
+    def head(user):
+        last = Change.objects.filter(user=user).order_by('-id').values_list('id', flat=True).first()
+        return ChangeFeedService.encode_cursor(last or 0)
+
+    @staticmethod
+    def feed(user, cursor, limit=DEFAULT_LIMIT):
+        """
+        Changes after `cursor` (an encoded cursor, or None for the current
+        head), compacted to the latest op per object. Returns
+        {'changes': [...], 'cursor': ..., 'has_more': bool}.
+        """
+        if cursor is None:
+            return {'changes': [], 'cursor': ChangeFeedService.head(user), 'has_more': False}
+        last_id = ChangeFeedService.decode_cursor(cursor)
+
+        read_at = time.time()
+        entries = list(
+            Change.objects.filter(user=user, id__gt=last_id)
+            .order_by('id').values_list('id', 'kind', 'object_id', 'op', 'created_at')[:limit + 1]
+        )
+        has_more = len(entries) > limit
+        entries = entries[:limit]
+        if not entries:
+            # nothing after last_id yet, whatever comes is newer than now
+            return {'changes': [], 'cursor': ChangeFeedService.encode_cursor(last_id, read_at), 'has_more': False}
+        # with more to come, the next page is only known to be no older than this one's last entry
+        stamp = entries[-1][4].timestamp() if has_more else read_at
+
+        # only the last entry of an object in this page matters
+        latest = {}
+        for entry_id, kind, object_id, op, _ in entries:
+            latest.pop((kind, object_id), None)
+            latest[(kind, object_id)] = op
+
+        upserts = {kind: [object_id for (k, object_id), op in latest.items() if k == kind and op == Change.UPSERT]
+                   for kind in (Change.APP, Change.SUBSCRIPTION)}
+        data = {}
+        if upserts[Change.APP]:
+            apps = Repository(App).filter_objects(user=user, id__in=upserts[Change.APP])
+            data.update({(Change.APP, row['id']): APP_ROWS.row(row) for row in APP_ROWS.values(apps)})
+        if upserts[Change.SUBSCRIPTION]:
+            subscriptions = Repository(Subscription).filter_objects(user=user, id__in=upserts[Change.SUBSCRIPTION])
+            data.update({(Change.SUBSCRIPTION, row['id']): SUBSCRIPTION_ROWS.row(row) for row in SUBSCRIPTION_ROWS.values(subscriptions)})
+
+        changes = []
+        for (kind, object_id), op in latest.items():
+            if op == Change.UPSERT:
+                if (kind, object_id) not in data:
+                    # deleted since, its delete entry is further along the log
+                    continue
+                changes.append({'kind': kind, 'op': op, 'id': str(object_id), 'data': data[(kind, object_id)]})
+            else:
+                changes.append({'kind': kind, 'op': op, 'id': str(object_id)})
+        return {'changes': changes, 'cursor': ChangeFeedService.encode_cursor(entries[-1][0], stamp), 'has_more': has_more}
+
+    @staticmethod
+    def get_changes(user, request):
+        try:
+            limit = max(1, min(int(request.GET.get('limit', ChangeFeedService.DEFAULT_LIMIT)), ChangeFeedService.MAX_LIMIT))
+        except ValueError:
+            return Response({'limit': 'Must be an integer.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            data = ChangeFeedService.feed(user, request.GET.get('cursor') or None, limit)
+        except InvalidCursor as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except ExpiredCursor as e:
+            return Response({'error': str(e)}, status=status.HTTP_410_GONE)
+        return Response(data)
+
+    @staticmethod
+    def compact(retention_days, batch_size=1000):
+        """
+        Drop entries superseded by a newer entry for the same object, and
+        every entry older than `retention_days`. Returns (superseded, expired).
+        """
+        repository = Repository(Change)
+        newer = Change.objects.filter(
+            user_id=OuterRef('user_id'), kind=OuterRef('kind'), object_id=OuterRef('object_id'), id__gt=OuterRef('id'),
+        )
+        superseded = ChangeFeedService._delete_in_batches(repository, repository.filter_objects().filter(Exists(newer)), batch_size)
+        horizon = timezone.now() - timedelta(days=retention_days)
+        expired = ChangeFeedService._delete_in_batches(repository, repository.filter_objects(created_at__lt=horizon), batch_size)
+        return superseded, expired
+
+    @staticmethod
+    def _delete_in_batches(repository, queryset, batch_size):
+        # ids first: MySQL can't DELETE from a table its subquery reads
+        total = 0
+        while True:
+            ids = list(queryset.order_by('id').values_list('id', flat=True)[:batch_size])
+            if not ids:
+                return total
+            total += repository.delete_objects(id__in=ids)
@@ -0,0 +1,111 @@
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+
+from appmanager.db.router import primary
+
+from ..models import App, PlanSubscriptionCount, Subscription
+from ..response_cache import response_cache
+
+
+class CounterService:
+    """
+    Denormalized per-user counters: apps owned and active subscriptions per
+    plan. Every change is a relative F() update, so concurrent writers never
+    overwrite each other; `reconcile` recomputes them from the source rows.
+    """
+
+    @staticmethod
+    def reserve_apps(user, count, limit=None):
+        """Add `count` to the user's app_count unless it would pass `limit`. Returns False when over quota."""
+        users = get_user_model().objects.filter(pk=user.pk)
+        if limit is not None:
+            users = users.filter(app_count__lte=limit - count)
+        return users.update(app_count=F('app_count') + count) == 1
+
+    @staticmethod
+    def adjust_apps(user_id, delta):
+        if delta:
+            get_user_model().objects.filter(pk=user_id).update(app_count=F('app_count') + delta)
+
+    @staticmethod
+    def adjust_plans(deltas):
+        """Apply {(user_id, plan_id): delta} to the active subscription counters."""
+        for (user_id, plan_id), delta in deltas.items():
+            if not delta or plan_id is None:
+                continue
+            counters = PlanSubscriptionCount.objects.filter(user_id=user_id, plan_id=plan_id)
+            if counters.update(active=F('active') + delta) or delta < 0:
+                # a missing row on decrement means drift, left to reconcile
+                continue
+            try:
+                with transaction.atomic():
+                    PlanSubscriptionCount.objects.create(user_id=user_id, plan_id=plan_id, active=delta)
+            except IntegrityError:
+                # created concurrently, the row exists now
+                counters.update(active=F('active') + delta)
+
+    @staticmethod
+    def active_by_plan(subscriptions):
+        """{(user_id, plan_id): n} for the active rows of a Subscription queryset, in one aggregate query."""
+        rows = subscriptions.filter(active=True).values('user_id', 'plan_id').annotate(n=Count('id'))
+        return Counter({(row['user_id'], row['plan_id']): row['n'] for row in rows})
+
+    @staticmethod
+    def negate(deltas):
+        return {key: -value for key, value in deltas.items()}
+
+    @staticmethod
+    def profile(user):
+        # active counts keyed by plan id, names are resolved from the plan catalogue
+        counts = PlanSubscriptionCount.objects.filter(user=user, active__gt=0).values_list('plan_id', 'active')
+        return dict(counts)
+
+    @staticmethod
+    def reconcile(batch_size=1000):
+        """Recompute every counter from App and Subscription rows. Returns the number of rows repaired."""
+        # a lagging replica would write stale counts back
+        with primary():
+            repaired = CounterService._reconcile(batch_size)
+        if repaired:
+            # cached profiles show the counters that were just repaired
+            response_cache.invalidate_all()
+        return repaired
+
+    @staticmethod
+    def _reconcile(batch_size):
+        User = get_user_model()
+        repaired = 0
+        last_pk = 0
+        while True:
+            users = list(User.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', 'app_count')[:batch_size])
+            if not users:
+                return repaired
+            last_pk = users[-1][0]
+            user_ids = [pk for pk, _ in users]
+
+            app_counts = dict(App.objects.filter(user_id__in=user_ids).values('user_id').annotate(n=Count('id')).values_list('user_id', 'n'))
+            for pk, stored in users:
+                actual = app_counts.get(pk, 0)
+                if stored != actual:
+                    User.objects.filter(pk=pk).update(app_count=actual)
+                    repaired += 1
+
+            actual_plans = CounterService.active_by_plan(Subscription.objects.filter(user_id__in=user_ids))
+            stored_plans = {
+                (counter.user_id, counter.plan_id): counter
+                for counter in PlanSubscriptionCount.objects.filter(user_id__in=user_ids)
+            }
+            for key, counter in stored_plans.items():
+                if counter.active != actual_plans.get(key, 0):
+                    PlanSubscriptionCount.objects.filter(pk=counter.pk).update(active=actual_plans.get(key, 0))
+                    repaired += 1
+            missing = [
+                PlanSubscriptionCount(user_id=user_id, plan_id=plan_id, active=n)
+                for (user_id, plan_id), n in actual_plans.items()
+                if (user_id, plan_id) not in stored_plans and plan_id is not None
+            ]
+            PlanSubscriptionCount.objects.bulk_create(missing)
+            repaired += len(missing)
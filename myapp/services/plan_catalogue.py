@@ -0,0 +1,100 @@
+import threading
+import time
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.core.cache import caches
+from django.db import transaction
+
+from ..models import Plan
+
+
+class PlanCatalogue:
+    """
+    Process-wide registry of the predefined plans.
+
+    Plans are loaded from the DB on first use and then served from memory,
+    tagged with the version found in the `versions` cache (shared by all
+    workers). A plan write bumps that version, so every worker reloads its
+    copy on its next use. When a shared cache alias is configured the plan
+    list lives in that cache instead, so every worker sees the same copy
+    and a single invalidation reaches all of them.
+    """
+    CACHE_KEY = 'plan_catalogue'
+    VERSION_KEY = 'plan_catalogue_version'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.configure()
+
+    def configure(self, cache_alias=None, versions_alias='default'):
+        self._cache = caches[cache_alias] if cache_alias else None
+        self._versions = caches[versions_alias]
+        self._plans = None
+        self._version = None
+
+    def _load(self):
+        return list(Plan.objects.order_by('price'))
+
+    def all(self):
+        if self._cache is not None:
+            plans = self._cache.get(self.CACHE_KEY)
+            if plans is None:
+                plans = self._load()
+                self._cache.set(self.CACHE_KEY, plans, None)
+            return plans
+
+        # read before loading, so a bump during the load triggers another one
+        version = self._versions.get(self.VERSION_KEY)
+        plans = self._plans
+        if plans is None or version != self._version:
+            with self._lock:
+                if self._plans is None or version != self._version:
+                    self._plans = self._load()
+                    self._version = version
+                plans = self._plans
+        return plans
+
+    def get(self, pk):
+        # None for an id the catalogue doesn't hold (deleted, or added after this copy was loaded)
+        return self._find(self.all(), pk)
+
+    def _find(self, plans, pk):
+        pk = pk if isinstance(pk, uuid.UUID) else uuid.UUID(str(pk))
+        for plan in plans:
+            if plan.pk == pk:
+                return plan
+        return None
+
+    def get_by_name(self, name):
+        for plan in self.all():
+            if plan.name == name:
+                return plan
+        raise Plan.DoesNotExist(f'Plan {name} does not exist.')
+
+    async def aall(self):
+        if self._cache is None and self._plans is not None:
+            if await self._versions.aget(self.VERSION_KEY) == self._version:
+                return self._plans
+        # first load (or a shared cache lookup) runs in the sync thread
+        return await sync_to_async(self.all)()
+
+    async def aget(self, pk):
+        return self._find(await self.aall(), pk)
+
+    def invalidate(self):
+        # wait for the commit so a reload can't pick up the old rows
+        transaction.on_commit(self._clear)
+
+    def _clear(self):
+        self._plans = None
+        if self._cache is not None:
+            self._cache.delete(self.CACHE_KEY)
+        # the other workers' copies
+        try:
+            self._versions.incr(self.VERSION_KEY)
+        except ValueError:
+            self._versions.add(self.VERSION_KEY, time.time_ns(), None)
+
+
+plan_catalogue = PlanCatalogue()
@@ -1,19 +1,46 @@
+import uuid
+from collections import Counter
+from datetime import date, timedelta
 from ..repositories.repository import Repository
-from ..models import App, Subscription, Plan
+from ..profiling import profile_methods
+from ..models import App, Change, Subscription, Plan
 from ..serializers import  SubscriptionSerializer, SubscriptionUpdateSerializer, PlanSerializer
+from ..pagination import KeysetPagination
+from .plan_catalogue import plan_catalogue
+from .counter_service import CounterService
+from .change_service import ChangeFeedService
+from ..conditional import conditional_response
+from ..responses import json_response
+from ..rows import SUBSCRIPTION_ROWS
 from rest_framework.response import Response
 from rest_framework import status
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
 from django.core.exceptions import PermissionDenied
 from django.shortcuts import get_object_or_404
 from django.http import Http404
 
+def create_free_plan_subscriptions(apps):
+    # set-based counterpart of the create_free_plan_subscription signal
+    free_plan = plan_catalogue.get_by_name("Free")
+    start_date = date.today()
+    subscriptions = Subscription.objects.bulk_create([
+        Subscription(app=app, user_id=app.user_id, plan=free_plan, active=True, start_date=start_date, end_date=start_date + timedelta(days=30))
+        for app in apps
+    ])
+    ChangeFeedService.record([(app.user_id, Change.SUBSCRIPTION, subscription.pk, Change.UPSERT) for app, subscription in zip(apps, subscriptions)])
+    return subscriptions
+
+
+@profile_methods('service')
 class SubscriptionService:
-    
+    BULK_UPDATE_LIMIT = 1000
+
     def __init__(self):
         self.repository = Repository(Subscription)
 
-    def get_subscription(self, user, app_id):
+    def get_subscription(self, user, app_id, request):
        
         app = self.repository.get_object_or_none(App, pk=app_id, user=user)
         if not app:
@@ -22,29 +49,87 @@ class SubscriptionService:
         subscription = self.repository.get_object_or_none(Subscription, app=app)
         if not subscription:
             return Response({'message': 'Subscription not found'}, status=status.HTTP_404_NOT_FOUND)
-        try:
-            serializer = SubscriptionSerializer(subscription)
-            return Response(serializer.data)
-        except self.repository.model.DoesNotExist:
-            return Response({'message': 'Subscription not found'}, status=status.HTTP_404_NOT_FOUND)
+        # reuse the loaded app and the catalogue plan instead of lazy lookups
+        subscription.app = app
+        plan = plan_catalogue.get(subscription.plan_id) if subscription.plan_id is not None else None
+        if plan is not None:
+            subscription.plan = plan
+        return conditional_response(
+            request, [subscription, app, subscription.plan],
+            lambda: Response(SubscriptionSerializer(subscription).data),
+        )
     
-    def get_user_subscriptions(self, user):
-        subscriptions = self.repository.filter_objects(app__user=user)
-        if subscriptions.exists():
-            serializer = SubscriptionSerializer(subscriptions, many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
-        else:
+    def filter_subscriptions(self, user, params):
+        """Returns (queryset, errors) for the active/plan filters in `params`."""
+        subscriptions = self.repository.filter_objects(user=user).select_related('app', 'plan')
+
+        active = params.get('active')
+        if active is not None:
+            if active.lower() not in ('true', 'false'):
+                return None, {'active': 'Must be true or false.'}
+            subscriptions = subscriptions.filter(active=active.lower() == 'true')
+
+        plan = params.get('plan')
+        if plan:
+            try:
+                subscriptions = subscriptions.filter(plan_id=uuid.UUID(plan))
+            except ValueError:
+                subscriptions = subscriptions.filter(plan__name__iexact=plan)
+        return subscriptions, None
+
+    def get_user_subscriptions(self, user, request):
+        subscriptions, errors = self.filter_subscriptions(user, request.GET)
+        if errors:
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        paginator = KeysetPagination(ordering=('start_date', 'id'))
+        page = paginator.paginate_queryset(SUBSCRIPTION_ROWS.values(subscriptions), request)
+        if not page and paginator.cursor is None:
             return Response({'message': 'No subscriptions'}, status=status.HTTP_404_NOT_FOUND)
+        return paginator.get_paginated_response(SUBSCRIPTION_ROWS.rows(page))
+
+    async def aget_user_subscriptions(self, user, request):
+        subscriptions, errors = self.filter_subscriptions(user, request.GET)
+        if errors:
+            return json_response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        paginator = KeysetPagination(ordering=('start_date', 'id'))
+        page = await paginator.apaginate_queryset(SUBSCRIPTION_ROWS.values(subscriptions), request)
+        if not page and paginator.cursor is None:
+            return json_response({'message': 'No subscriptions'}, status=status.HTTP_404_NOT_FOUND)
+        return json_response(paginator.get_paginated_data(SUBSCRIPTION_ROWS.rows(page)))
+
+    async def aget_subscription(self, user, app_id, request):
+        app = await self.repository.aget_object_or_none(App, pk=app_id, user=user)
+        if not app:
+            return json_response({'message': 'App not found or does not belong to the user'}, status=status.HTTP_404_NOT_FOUND)
+
+        subscription = await self.repository.aget_object_or_none(Subscription, app=app)
+        if not subscription:
+            return json_response({'message': 'Subscription not found'}, status=status.HTTP_404_NOT_FOUND)
+        subscription.app = app
+        if subscription.plan_id is not None:
+            # a plan this worker's catalogue doesn't hold yet is read from the DB (no lazy loads here)
+            subscription.plan = (
+                await plan_catalogue.aget(subscription.plan_id)
+                or await self.repository.aget_object_or_none(Plan, pk=subscription.plan_id)
+            )
+        return conditional_response(
+            request, [subscription, app, subscription.plan],
+            lambda: json_response(SubscriptionSerializer(subscription).data),
+        )
      
     
     def update_subscription(self, user, subscription_id, update_data):
-        try:
-            subscription = self.repository.get_object(pk=subscription_id)
-        except Subscription.DoesNotExist:
+        # ownership is checked by the fetch itself, the app comes along for the counters
+        subscription = self.repository.filter_objects(pk=subscription_id, user=user).select_related('app').first()
+        if subscription is None:
+            if self.repository.filter_objects(pk=subscription_id).exists():
+                raise PermissionDenied('Permission denied. This subscription does not belong to this user.')
             raise Http404('Subscription not found.')
-
-        if subscription.app.user != user:
-            raise PermissionDenied('Permission denied. This subscription does not belong to this user.')
+        plan = plan_catalogue.get(subscription.plan_id) if subscription.plan_id is not None else None
+        if plan is not None:
+            subscription.plan = plan
 
         serializer = SubscriptionUpdateSerializer(subscription, data=update_data, partial=True)
         if serializer.is_valid(raise_exception=True):
@@ -54,19 +139,146 @@ class SubscriptionService:
                 'message': 'Subscription updated successfully.'
                 }
             return response_data
-    
+
+    def bulk_change_plan(self, user, data):
+        """
+        Move the given subscriptions (`ids`, or every match of `filter`) to
+        `plan` with one UPDATE. As in SubscriptionUpdateSerializer.update, a
+        plan change starts a new 30 day period; rows already on the plan are
+        left untouched. Returns ({'results': [...]}, status).
+        """
+        if not isinstance(data, dict):
+            return {'error': 'Expected an object with plan and ids or filter.'}, status.HTTP_400_BAD_REQUEST
+        try:
+            plan = plan_catalogue.get(data.get('plan'))
+        except (TypeError, ValueError, AttributeError):
+            plan = None
+        if plan is None:
+            return {'error': 'plan must be the id of an existing plan.'}, status.HTTP_400_BAD_REQUEST
+
+        ids = data.get('ids')
+        filters = data.get('filter')
+        if (ids is None) == (filters is None):
+            return {'error': 'Pass either ids or filter.'}, status.HTTP_400_BAD_REQUEST
+        if ids is not None:
+            if not isinstance(ids, list) or not ids:
+                return {'error': 'Expected a non-empty list of subscription ids.'}, status.HTTP_400_BAD_REQUEST
+            if len(ids) > self.BULK_UPDATE_LIMIT:
+                return {'error': f'At most {self.BULK_UPDATE_LIMIT} subscriptions can be changed at once.'}, status.HTTP_400_BAD_REQUEST
+            try:
+                ids = list(dict.fromkeys(uuid.UUID(str(pk)) for pk in ids))
+            except ValueError:
+                return {'error': 'Subscription ids must be valid UUIDs.'}, status.HTTP_400_BAD_REQUEST
+            subscriptions = self.repository.filter_objects(user=user, id__in=ids)
+        else:
+            if not isinstance(filters, dict):
+                return {'error': 'filter must be an object.'}, status.HTTP_400_BAD_REQUEST
+            subscriptions, errors = self.filter_subscriptions(user, {key: str(value) for key, value in filters.items()})
+            if errors:
+                return errors, status.HTTP_400_BAD_REQUEST
+
+        start_date = timezone.localdate()
+        with transaction.atomic():
+            # lock the matched rows so the counter deltas match what the UPDATE changes
+            rows = list(subscriptions.select_for_update(of=('self',)).order_by('id').values_list('id', 'plan_id', 'active')[:self.BULK_UPDATE_LIMIT + 1])
+            if len(rows) > self.BULK_UPDATE_LIMIT:
+                transaction.set_rollback(True)
+                return {'error': f'The filter matches more than {self.BULK_UPDATE_LIMIT} subscriptions, narrow it down.'}, status.HTTP_400_BAD_REQUEST
+
+            changed = [pk for pk, plan_id, _ in rows if plan_id != plan.pk]
+            if changed:
+                self.repository.filter_objects(id__in=changed).update(
+                    plan=plan, start_date=start_date, end_date=start_date + timedelta(days=30), updated_at=timezone.now(),
+                )
+                ChangeFeedService.record([(user.pk, Change.SUBSCRIPTION, pk, Change.UPSERT) for pk in changed])
+            deltas = Counter()
+            for _, plan_id, active in rows:
+                if active and plan_id != plan.pk:
+                    deltas[(user.pk, plan_id)] -= 1
+                    deltas[(user.pk, plan.pk)] += 1
+            CounterService.adjust_plans(deltas)
+
+        found = {pk: plan_id for pk, plan_id, _ in rows}
+        results = [
+            {'id': str(pk), 'status': 'updated' if found[pk] != plan.pk else 'unchanged'}
+            for pk in (ids if ids is not None else found) if pk in found
+        ]
+        if ids is not None:
+            results += [{'id': str(pk), 'status': 'not_found'} for pk in ids if pk not in found]
+        return {'plan': plan.name, 'updated': len(changed), 'results': results}, status.HTTP_200_OK
+
+class SubscriptionExpiryService:
+    """
+    Deactivates (or renews) active subscriptions whose end_date has passed.
+
+    Work is done in bounded batches: a batch of ids is read off the
+    (active, end_date) index in (end_date, id) order, then changed with a
+    single UPDATE, so locks are only ever held on one batch of rows.
+    """
+
+    def __init__(self, today=None, renew=False):
+        self.repository = Repository(Subscription)
+        self.today = today or timezone.localdate()
+        self.renew = renew
+
+    def expired(self, after=None):
+        subscriptions = self.repository.filter_objects(active=True, end_date__lt=self.today)
+        if after is not None:
+            end_date, pk = after
+            subscriptions = subscriptions.filter(Q(end_date__gt=end_date) | Q(end_date=end_date, id__gt=pk))
+        return subscriptions.order_by('end_date', 'id')
+
+    def changes(self):
+        if self.renew:
+            # same reset as a plan change in SubscriptionUpdateSerializer.update
+            return {'start_date': self.today, 'end_date': self.today + timedelta(days=30), 'updated_at': timezone.now()}
+        return {'active': False, 'updated_at': timezone.now()}
+
+    def run_batch(self, batch_size, after=None, dry_run=False):
+        """Process one batch, returns (rows, checkpoint) where checkpoint is the last (end_date, id)."""
+        keys = list(self.expired(after).values_list('end_date', 'id')[:batch_size])
+        if not keys:
+            return 0, None
+        if dry_run:
+            return len(keys), keys[-1]
+        # re-check the predicate so rows changed since the read are left alone
+        batch = self.repository.filter_objects(id__in=[pk for _, pk in keys], active=True, end_date__lt=self.today)
+        with transaction.atomic():
+            # lock the batch so the counters and the change log match exactly what gets changed
+            rows = list(batch.select_for_update(of=('self',)).values_list('user_id', 'id', 'plan_id'))
+            updated = batch.update(**self.changes())
+            if not self.renew:
+                # every row of the batch was active
+                CounterService.adjust_plans(CounterService.negate(Counter((user_id, plan_id) for user_id, _, plan_id in rows)))
+            ChangeFeedService.record([(user_id, Change.SUBSCRIPTION, pk, Change.UPSERT) for user_id, pk, _ in rows])
+        return updated, keys[-1]
+
+
+@profile_methods('service')
 class PlanService:
     
     def __init__(self):
         self.repository = Repository(Plan)
 
-    def get_plans(self):
-        plans = self.repository.filter_objects()
-        if plans.exists():
-            serializer = PlanSerializer(plans, many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+    def get_plans(self, request):
+        plans = plan_catalogue.all()
+        if plans:
+            return conditional_response(
+                request, plans,
+                lambda: Response(PlanSerializer(plans, many=True).data, status=status.HTTP_200_OK),
+            )
+        else:
+            return Response({'message': 'No Plans Predefined'}, status=status.HTTP_404_NOT_FOUND)
+
+    async def aget_plans(self, request):
+        plans = await plan_catalogue.aall()
+        if plans:
+            return conditional_response(
+                request, plans,
+                lambda: json_response(PlanSerializer(plans, many=True).data, status=status.HTTP_200_OK),
+            )
         else:
-            return Response({'message': 'No Plans Predefined'}, status=status.HTTP_404_NOT_FOUND)    
+            return json_response({'message': 'No Plans Predefined'}, status=status.HTTP_404_NOT_FOUND)    
         
     
     
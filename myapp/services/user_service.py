@@ -1,9 +1,14 @@
 from rest_framework import status
 from rest_framework.response import Response
-from ..serializers import UserSerializer, LoginSerializer, AuthResponseSerializer
-from django.contrib.auth import logout
-from django.core.exceptions import ObjectDoesNotExist
+from ..profiling import profile_methods
+from ..serializers import UserSerializer, UserProfileSerializer, LoginSerializer, AuthResponseSerializer
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password, identify_hasher
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
+from django.db import transaction
+from django.db.models.functions import Lower
 
+@profile_methods('service')
 class UserService:
     @staticmethod
     def register(request):
@@ -29,18 +34,95 @@ class UserService:
     
     @staticmethod
     def userProfile(request):
-        serializer = UserSerializer(request.user)
+        # the authenticated user may come from the token cache, counters are read fresh
+        request.user.refresh_from_db(fields=['app_count'])
+        serializer = UserProfileSerializer(request.user)
         return Response(serializer.data)
     
     @staticmethod
     def logout_user(request):
+        # the API has no session to flush, revoking the token is the logout
         try:
-            request.user.auth_token.delete()
+            # request.auth is the token resolved during authentication,
+            # deleting it also evicts it from the auth cache
+            token = request.auth or request.user.auth_token
+            token.delete()
         except (AttributeError, ObjectDoesNotExist):
             # in case token does not exist
             pass
-        # Perform the logout
-        logout(request)
-    
 
+    @staticmethod
+    def bulk_import(rows, batch_size=500):
+        """
+        Create users from dicts with username, email, first_name, last_name,
+        phone and either a raw `password` or an already hashed `password_hash`.
+        Usernames compare case-insensitively, as MySQL's collation does;
+        existing ones are skipped and rows failing the User field validators
+        are counted as invalid. Each batch is one transaction costing one
+        lookup and one insert.
+        """
+        User = get_user_model()
+        stats = {'created': 0, 'skipped': 0, 'invalid': 0}
+        seen = set()
+        batch = []
+
+        def flush():
+            with transaction.atomic():
+                existing = set(User.objects.annotate(lower_username=Lower('username')).filter(
+                    lower_username__in=[user.username.lower() for user in batch],
+                ).values_list('username', flat=True))
+                existing = {username.casefold() for username in existing}
+                users = [user for user in batch if user.username.casefold() not in existing]
+                User.objects.bulk_create(users)
+            stats['skipped'] += len(batch) - len(users)
+            stats['created'] += len(users)
+            batch.clear()
+
+        for row in rows:
+            user = UserService.import_user(row)
+            if user is None:
+                stats['invalid'] += 1
+                continue
+            if user.username.casefold() in seen:
+                stats['skipped'] += 1
+                continue
+            seen.add(user.username.casefold())
+            batch.append(user)
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+        return stats
+
+    @staticmethod
+    def import_user(row):
+        # an unsaved User for an export row, None when the row doesn't validate
+        User = get_user_model()
+        fields = {
+            name: str(row.get(name) or '').strip()
+            for name in ('username', 'email', 'first_name', 'last_name', 'phone')
+        }
+        user = User(**fields, is_active=True)
+        # signup requires a phone, accounts from the old system may lack one
+        exclude = {'password'} if user.phone else {'password', 'phone'}
+        try:
+            user.clean()
+            user.clean_fields(exclude=exclude)
+        except ValidationError:
+            return None
+        user.password = UserService.import_password(row)
+        return user
+
+    @staticmethod
+    def import_password(row):
+        # hashes from the old system are kept when Django can verify them,
+        # otherwise the raw password is hashed (or left unusable)
+        password_hash = row.get('password_hash')
+        if password_hash:
+            try:
+                identify_hasher(password_hash)
+                return password_hash
+            except ValueError:
+                pass
+        return make_password(row.get('password') or None)
 
@@ -1,10 +1,54 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
+from django.contrib.auth import get_user_model
 from django.dispatch import receiver
-from .models import App, Plan, Subscription
+from rest_framework.authtoken.models import Token
+from .models import App, Change, Plan, Subscription
+from .authentication import invalidate_cached_token
+from .services.plan_catalogue import plan_catalogue
+from .services.change_service import ChangeFeedService
+from .response_cache import response_cache
 
 @receiver(post_save, sender=App)
 def create_free_plan_subscription(sender, instance, created, **kwargs):
     if created:
         # auto add free plan to new app
-        free_plan = Plan.objects.get(name="Free")
-        Subscription.objects.create(app=instance, plan=free_plan, active=True)
+        free_plan = plan_catalogue.get_by_name("Free")
+        subscription = Subscription.objects.create(app=instance, plan=free_plan, active=True)
+        ChangeFeedService.record([(instance.user_id, Change.SUBSCRIPTION, subscription.pk, Change.UPSERT)])
+
+
+@receiver(post_save, sender=App)
+@receiver(post_delete, sender=App)
+def invalidate_app_responses(sender, instance, **kwargs):
+    # saves and deletes outside the API (admin, shell) don't go through the change feed
+    response_cache.invalidate([instance.user_id])
+
+
+@receiver(post_delete, sender=Token)
+def clear_cached_token(sender, instance, **kwargs):
+    # logout deletes the token row, rotation evicts the old key itself
+    invalidate_cached_token(instance.key)
+
+
+@receiver(post_save, sender=Plan)
+@receiver(post_delete, sender=Plan)
+def invalidate_plan_catalogue(sender, **kwargs):
+    plan_catalogue.invalidate()
+    # plan names and prices are embedded in cached responses of every user
+    response_cache.invalidate_all()
+
+
+@receiver(post_save, sender=get_user_model())
+def invalidate_user_responses(sender, instance, **kwargs):
+    # the profile response carries the user's own fields
+    response_cache.invalidate([instance.pk])
+
+
+@receiver(post_save, sender=get_user_model())
+def clear_cached_user_tokens(sender, instance, created, update_fields=None, **kwargs):
+    # cached tokens carry the user, so a deactivated (or otherwise edited) user
+    # is re-read on the next request; logins only touch last_login
+    if created or update_fields == frozenset(['last_login']):
+        return
+    for key in Token.objects.filter(user=instance).values_list('key', flat=True):
+        invalidate_cached_token(key)
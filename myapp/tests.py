@@ -1,12 +1,50 @@
-from django.test import TestCase
+from unittest import skipUnless
+from django.conf import settings
+from django.core.cache import caches
+from django.test import TestCase, SimpleTestCase, TransactionTestCase, override_settings
+from appmanager.db.router import ReplicaRouter, primary, use_primary
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.http import HttpResponse
+from django.test import AsyncClient, RequestFactory
+from .middleware import ReplicaPinningMiddleware
+from appmanager.db.mysql.operations import DatabaseOperations as MySQLOperations
+from rest_framework.test import APIClient
+from rest_framework.renderers import JSONRenderer
+from .rows import APP_ROWS, SUBSCRIPTION_ROWS
+from .serializers import AppSerializer, SubscriptionSerializer
+import os
+import sqlite3
+import tempfile
+import threading
+import uuid
+from django.db import OperationalError, connection
+from django.test.utils import CaptureQueriesContext
+from appmanager.db.pool import ConnectionLimiter
+from .authentication import rotate_token
+from .benchmarks import run_benchmarks, run_key_benchmark
+from .fields import BinaryUUIDField
+from .ids import uuid7
+from .response_cache import LocalLRU, response_cache
+from types import SimpleNamespace
+from django.core.management import call_command
+from django.contrib.auth.hashers import make_password
+from io import StringIO
+import json
 
 # Create your tests here.
+from django.apps import apps as django_apps
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APITestCase
-from .models import App, Subscription, Plan
+from .models import App, Change, Subscription, Plan, PlanSubscriptionCount
+from .services.change_service import ChangeFeedService
+from .services.subscription_service import SubscriptionService
+from .services.plan_catalogue import PlanCatalogue, plan_catalogue
 from rest_framework.authtoken.models import Token
+from django.utils import timezone
+from datetime import timedelta
 
 class AppTestCase(APITestCase):
     def setUp(self):
@@ -29,6 +67,35 @@ class AppTestCase(APITestCase):
         self.assertEqual(App.objects.count(), 1)
         self.assertEqual(App.objects.get().name, 'Test App')
     
+    def test_bulk_create_apps(self):
+        App.objects.create(user=self.user, name='Existing', description='desc')
+        data = [
+            {'name': 'Bulk 1', 'description': 'desc'},
+            {'name': 'Existing', 'description': 'desc'},
+            {'name': 'Bulk 2', 'description': 'desc'},
+            {'name': 'Bulk 1', 'description': 'duplicate in batch'},
+            {'name': 'Bulk 3'},
+            {'name': 'EXISTING', 'description': 'differs only in case'},
+            {'name': 'bulk 2', 'description': 'differs only in case'},
+        ]
+        response = self.client.post(reverse('bulk-create-apps'), data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([app['name'] for app in response.data['created']], ['Bulk 1', 'Bulk 2'])
+        self.assertEqual([error['index'] for error in response.data['errors']], [1, 3, 4, 5, 6])
+        self.assertEqual(Subscription.objects.filter(app__name__startswith='Bulk', plan__name='Free').count(), 2)
+
+    def test_bulk_create_apps_query_count_is_constant(self):
+        data = [{'name': f'Bulk {i}', 'description': 'desc'} for i in range(50)]
+        plan_catalogue.all()
+        PlanSubscriptionCount.objects.create(user=self.user, plan=self.plan)
+        # token, name check, savepoint, app_count update, app insert, user lock, app change log,
+        # subscription insert, user lock, subscription change log, plan counter update, release
+        with self.assertNumQueries(12):
+            response = self.client.post(reverse('bulk-create-apps'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Subscription.objects.filter(app__user=self.user).count(), 50)
+
     def test_update_app(self):
         app = App.objects.create(user=self.user, name='facebook', description='Social Media')
         url = reverse('update-app', args=[app.id])
@@ -38,6 +105,77 @@ class AppTestCase(APITestCase):
         app.refresh_from_db()
         self.assertEqual(app.name, 'Updated App')    
         
+    def test_get_app_includes_subscription_and_plan(self):
+        app = App.objects.create(user=self.user, name='Card', description='desc')
+        subscription = Subscription.objects.get(app=app)
+        plan_catalogue.all()
+        url = reverse('app', args=[app.id])
+        # token, subscription joined with its app
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {'include': 'subscription,plan'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['name'], 'Card')
+        self.assertEqual(response.data['subscription']['id'], str(subscription.id))
+        self.assertEqual(response.data['subscription']['plan']['name'], 'Free')
+
+        response = self.client.get(url, {'include': 'subscription'})
+        self.assertEqual(response.data['subscription']['plan'], str(self.plan.id))
+        # a different representation of the same rows gets its own etag
+        self.assertNotEqual(response['ETag'], self.client.get(url)['ETag'])
+
+        response = self.client.get(url, {'include': 'owner'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_include_plan_missing_from_catalogue(self):
+        app = App.objects.create(user=self.user, name='Legacy', description='desc')
+        plan_catalogue.all()
+        # created after this worker loaded its catalogue
+        legacy = Plan.objects.create(name='Legacy', price=5)
+        Subscription.objects.filter(app=app).update(plan=legacy)
+        for name in ('app', 'async-app'):
+            response = self.client.get(reverse(name, args=[app.id]), {'include': 'plan'})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertIsNone(response.json()['subscription']['plan'])
+        self.assertIsNone(plan_catalogue.get(uuid7()))
+
+    def test_subscription_on_plan_missing_from_catalogue(self):
+        app = App.objects.create(user=self.user, name='Legacy', description='desc')
+        plan_catalogue.all()
+        legacy = Plan.objects.create(name='Legacy', price=5)
+        Subscription.objects.filter(app=app).update(plan=legacy)
+        for name in ('app-subscription-detail', 'async-app-subscription-detail'):
+            response = self.client.get(reverse(name, args=[app.id]))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.json()['plan'], 'Legacy')
+            self.assertEqual(response.json()['plan_price'], '5.00')
+
+    def test_get_user_apps_includes_subscriptions_in_one_extra_query(self):
+        for i in range(5):
+            App.objects.create(user=self.user, name=f'App {i}', description='desc')
+        plan_catalogue.all()
+        # token, apps page, subscriptions of the page
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('user-apps'), {'include': 'plan'})
+        results = response.data['results']
+        self.assertEqual(len(results), 5)
+        self.assertTrue(all(result['subscription']['plan']['name'] == 'Free' for result in results))
+
+    def test_update_app_checks_ownership_in_the_fetch(self):
+        app = App.objects.create(user=self.user, name='facebook', description='Social Media')
+        other = App.objects.create(user=self.user2, name='other', description='desc')
+        url = reverse('update-app', args=[app.id])
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.patch(url, {'description': 'Updated'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # token, owned app fetch, savepoint, update, user lock, change log, release
+        self.assertEqual(len(captured), 7)
+        update = next(query['sql'] for query in captured if query['sql'].startswith('UPDATE'))
+        self.assertIn(connection.ops.quote_name('description'), update)
+        self.assertNotIn(connection.ops.quote_name('name'), update)
+
+        response = self.client.patch(reverse('update-app', args=[other.id]), {'description': 'x'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
     def test_delete_app(self):
         app = App.objects.create(user=self.user, name='App to Delete', description='App description')
         Subscription.objects.create(app=app, plan=self.plan)
@@ -47,6 +185,33 @@ class AppTestCase(APITestCase):
         self.assertEqual(App.objects.count(), 0)
         self.assertEqual(Subscription.objects.count(), 0)
     
+    def test_delete_app_uses_set_based_statements(self):
+        app = App.objects.create(user=self.user, name='App to Delete', description='App description')
+        url = reverse('delete-app', args=[app.id])
+        # token, savepoint, subscription rows, app rows (for post_delete), cascaded subscription
+        # delete, app delete, app_count update, plan counter update, user lock, change log, release
+        with self.assertNumQueries(11):
+            response = self.client.delete(url)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(Subscription.objects.filter(app_id=app.id).exists())
+
+    def test_delete_other_user_app(self):
+        app = App.objects.create(user=self.user2, name='Not Mine', description='App description')
+        response = self.client.delete(reverse('delete-app', args=[app.id]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertTrue(Subscription.objects.filter(app=app).exists())
+
+    def test_bulk_delete_apps(self):
+        mine = [App.objects.create(user=self.user, name=f'Mine {i}', description='desc') for i in range(3)]
+        other = App.objects.create(user=self.user2, name='Theirs', description='desc')
+        data = {'ids': [str(app.id) for app in mine] + [str(other.id)]}
+        response = self.client.delete(reverse('bulk-delete-apps'), data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'apps_deleted': 3, 'subscriptions_deleted': 3})
+        self.assertEqual(list(App.objects.values_list('name', flat=True)), ['Theirs'])
+        self.assertTrue(Subscription.objects.filter(app=other).exists())
+
     def test_get_user_apps(self):
          # Create apps for both users
         App.objects.create(name='User1 App1', description='App owned by user1', user=self.user)
@@ -59,18 +224,40 @@ class AppTestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
         # Check that only the apps belonging to user1 are returned
-        self.assertEqual(len(response.data), 2)  # Assuming the response data is a list of app objects
+        self.assertEqual(len(response.data['results']), 2)  # apps are returned as a paginated page
 
         # Verify that each returned app belongs to user1
-        for app_data in response.data:
+        for app_data in response.data['results']:
             self.assertEqual(app_data['user'], self.user.id)  # Assuming the response includes user IDs
 
         # Verify the names of the apps to ensure the correct ones are returned
-        app_names = {app['name'] for app in response.data}
+        app_names = {app['name'] for app in response.data['results']}
         self.assertIn('User1 App1', app_names)
         self.assertIn('User1 App2', app_names)
         self.assertNotIn('User2 App1', app_names)    
     
+    def test_get_user_apps_name_prefix_and_cursor(self):
+        for name in ['alpha', 'alpine', 'beta']:
+            App.objects.create(name=name, description='desc', user=self.user)
+        url = reverse('user-apps')
+
+        # case-insensitive, like the names' uniqueness
+        response = self.client.get(url, {'name': 'ALP', 'page_size': 1})
+        self.assertEqual([a['name'] for a in response.data['results']], ['alpha'])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([a['name'] for a in response.data['results']], ['alpine'])
+        self.assertIsNone(response.data['next'])
+
+    def test_get_user_apps_ndjson_stream(self):
+        App.objects.create(name='one', description='desc', user=self.user)
+        App.objects.create(name='two', description='desc', user=self.user)
+        response = self.client.get(reverse('user-apps'), {'stream': 'ndjson'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['name'] for line in lines], ['one', 'two'])
+
     def test_get_own_app(self):
         # Create an app for user1
         self.app_user1 = App.objects.create(name='User1 App', description='An app owned by user1', user=self.user)
@@ -83,6 +270,23 @@ class AppTestCase(APITestCase):
         self.assertEqual(response.data['name'], self.app_user1.name)
         self.assertEqual(response.data['user'], self.user.id)  # Ensure your serializer includes the user field
 
+    def test_get_app_conditional_get(self):
+        app = App.objects.create(name='Polled App', description='desc', user=self.user)
+        url = reverse('app', args=[app.id])
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('W/'))
+        self.assertIn('Last-Modified', response)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        app.description = 'changed'
+        app.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
     def test_get_other_user_app(self):
         # Create an app for user2
         self.app_user2 = App.objects.create(name='User2 App', description='An app owned by user2', user=self.user2)
@@ -106,9 +310,53 @@ class AppTestCase(APITestCase):
         response = self.client.get(url)
         
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        # Assuming the response contains a list of subscriptions
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]['id'], str(self.subscription.id))
+        # subscriptions are returned as a keyset-paginated page
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['id'], str(self.subscription.id))
+        self.assertIsNone(response.data['next'])
+
+    def test_get_user_subscriptions_paginates_in_one_query(self):
+        for i in range(15):
+            App.objects.create(user=self.user, name=f'App {i}', description='App Description')
+        url = reverse('user-subscriptions')
+
+        # token lookup + one joined page query
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 10)
+        self.assertEqual(response.data['results'][0]['plan'], 'Free')
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertIsNone(response.data['next'])
+
+    def test_subscriptions_carry_their_app_user(self):
+        App.objects.create(user=self.user, name='Signal App', description='App Description')
+        self.client.post(reverse('bulk-create-apps'), [{'name': 'Bulk App', 'description': 'desc'}], format='json')
+        self.assertEqual(
+            sorted(Subscription.objects.filter(user=self.user).values_list('app__name', flat=True)),
+            ['Bulk App', 'Signal App'],
+        )
+        # the per-user listing seeks the (user, start_date, id) index
+        subscriptions, _ = SubscriptionService().filter_subscriptions(self.user, {})
+        plan = subscriptions.order_by('start_date', 'id').explain()
+        self.assertIn('subscription_user_start_id_idx', plan)
+
+    def test_get_user_subscriptions_filters(self):
+        app = App.objects.create(user=self.user, name='Active App', description='App Description')
+        App.objects.create(user=self.user, name='Inactive App', description='App Description')
+        Subscription.objects.filter(app__name='Inactive App').update(active=False)
+        url = reverse('user-subscriptions')
+
+        response = self.client.get(url, {'active': 'true'})
+        self.assertEqual([s['app'] for s in response.data['results']], [app.name])
+
+        response = self.client.get(url, {'plan': 'Pro'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        response = self.client.get(url, {'active': 'maybe'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         
     def test_get_user_app_subscription(self):
         self.app = App.objects.create(user=self.user, name='User App', description='App Description')
@@ -120,6 +368,25 @@ class AppTestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['id'], str(self.subscription.id))
     
+    def test_get_user_app_subscription_conditional_get(self):
+        app = App.objects.create(user=self.user, name='User App', description='App Description')
+        url = reverse('app-subscription-detail', args=[app.id])
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # renaming the app changes the embedded app name, so the etag moves too
+        app.name = 'Renamed App'
+        app.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['app'], 'Renamed App')
+
+    def test_get_plans_conditional_get(self):
+        etag = self.client.get(reverse('plans'))['ETag']
+        response = self.client.get(reverse('plans'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
     def test_update_subscription(self):
         self.app = App.objects.create(user=self.user, name='User App', description='App Description')
         self.subscription = Subscription.objects.get(app=self.app)
@@ -132,6 +399,55 @@ class AppTestCase(APITestCase):
         self.subscription.refresh_from_db()
         self.assertFalse(self.subscription.active)
     
+    def test_update_subscription_resolves_plan_from_catalogue(self):
+        app = App.objects.create(user=self.user, name='User App', description='App Description')
+        subscription = Subscription.objects.get(app=app)
+        pro = Plan.objects.get(name='Pro')
+        PlanSubscriptionCount.objects.create(user=self.user, plan=pro)
+        plan_catalogue.all()
+        url = reverse('update-subscription', args=[subscription.id])
+        # token, owned subscription fetch, savepoint, update, Free counter update,
+        # Pro counter update, user lock, change log, release
+        with self.assertNumQueries(9):
+            response = self.client.patch(url, {'plan': str(pro.id)}, format='json')
+        self.assertEqual(response.data['plan_name'], 'Pro')
+
+        # nothing changed, nothing written: token and owned subscription fetch
+        with self.assertNumQueries(2):
+            self.client.patch(url, {'plan': str(pro.id)}, format='json')
+
+    def test_bulk_change_plan(self):
+        apps = [App.objects.create(user=self.user, name=f'App {i}', description='desc') for i in range(3)]
+        other = App.objects.create(user=self.user2, name='Other', description='desc')
+        ids = [str(Subscription.objects.get(app=app).id) for app in apps]
+        foreign = str(Subscription.objects.get(app=other).id)
+        standard = Plan.objects.get(name='Standard')
+        Subscription.objects.filter(app=apps[0]).update(plan=standard, start_date=timezone.localdate() - timedelta(days=10))
+
+        response = self.client.post(reverse('bulk-change-plan'), {'plan': str(standard.id), 'ids': ids + [foreign]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['updated'], 2)
+        statuses = {result['id']: result['status'] for result in response.data['results']}
+        self.assertEqual(statuses, {ids[0]: 'unchanged', ids[1]: 'updated', ids[2]: 'updated', foreign: 'not_found'})
+
+        self.assertEqual(Subscription.objects.filter(app__user=self.user, plan=standard).count(), 3)
+        self.assertEqual(Subscription.objects.get(app=other).plan, self.plan)
+        # unchanged rows keep their period, changed rows start a new one
+        self.assertEqual(Subscription.objects.get(app=apps[0]).start_date, timezone.localdate() - timedelta(days=10))
+        self.assertEqual(Subscription.objects.get(app=apps[1]).end_date, timezone.localdate() + timedelta(days=30))
+
+    def test_bulk_change_plan_by_filter(self):
+        for i in range(3):
+            App.objects.create(user=self.user, name=f'App {i}', description='desc')
+        pro = Plan.objects.get(name='Pro')
+        data = {'plan': str(pro.id), 'filter': {'plan': 'Free'}}
+        response = self.client.post(reverse('bulk-change-plan'), data, format='json')
+        self.assertEqual(response.data['updated'], 3)
+        self.assertFalse(Subscription.objects.filter(app__user=self.user, plan=self.plan).exists())
+
+        response = self.client.post(reverse('bulk-change-plan'), {'plan': str(pro.id)}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_get_plans(self):   
         url = reverse('plans')
         response = self.client.get(url)
@@ -145,6 +461,697 @@ class AppTestCase(APITestCase):
         
         # Verify that all expected plans are in the response
         for plan_name in ['Free', 'Standard', 'Pro']:
-            self.assertIn(plan_name, plan_names)    
+            self.assertIn(plan_name, plan_names)
+
+    def test_get_plans_served_from_catalogue(self):
+        plan_catalogue.all()
+        # only the token lookup touches the DB
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('plans'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_plan_catalogue_invalidated_on_plan_save(self):
+        self.addCleanup(plan_catalogue._clear)
+        plan_catalogue.all()
+        pro = Plan.objects.get(name='Pro')
+        pro.price = 30
+        with self.captureOnCommitCallbacks(execute=True):
+            pro.save()
+        self.assertEqual(plan_catalogue.get_by_name('Pro').price, 30)
+
+    def test_plan_save_reloads_other_workers_catalogue(self):
+        self.addCleanup(plan_catalogue._clear)
+        other_worker = PlanCatalogue()
+        other_worker.all()
+        Plan.objects.filter(name='Pro').update(price=30)
+        self.assertEqual(other_worker.get_by_name('Pro').price, 25)
+        legacy = Plan(name='Legacy', price=5)
+        with self.captureOnCommitCallbacks(execute=True):
+            legacy.save()
+        self.assertEqual(other_worker.get_by_name('Pro').price, 30)
+        self.assertEqual(other_worker.get(legacy.pk), legacy)
+        self.assertEqual(async_to_sync(other_worker.aget)(legacy.pk), legacy)
+
+    @override_settings(PLAN_CATALOGUE_CACHE='default')
+    def test_refuses_a_per_process_catalogue_cache(self):
+        with self.assertRaises(ImproperlyConfigured):
+            django_apps.get_app_config('myapp').check_shared_caches()
+
+    def test_update_subscription_rejects_unknown_plan(self):
+        app = App.objects.create(user=self.user, name='User App', description='App Description')
+        subscription = Subscription.objects.get(app=app)
+        url = reverse('update-subscription', args=[subscription.id])
+        response = self.client.patch(url, {'plan': str(app.id)}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ExpiringTokenAuthenticationTestCase(APITestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(username='authuser', password='testpassword')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    @override_settings(TOKEN_CACHE_SECONDS=60)
+    def test_token_and_user_resolved_in_one_query_then_cached(self):
+        plan_catalogue.all()
+        url = reverse('plans')
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @override_settings(TOKEN_CACHE_SECONDS=60)
+    def test_deactivated_user_is_not_served_from_cache(self):
+        self.client.get(reverse('user-profile'))
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.get(reverse('user-profile'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_refuses_a_per_process_token_cache(self):
+        config = django_apps.get_app_config('myapp')
+        with override_settings(TOKEN_CACHE_SECONDS=60):
+            with self.assertRaises(ImproperlyConfigured):
+                config.check_shared_caches()
+
+    @override_settings(TOKEN_CACHE_SECONDS=60)
+    def test_logout_invalidates_cached_token(self):
+        self.client.get(reverse('user-profile'))
+        response = self.client.get(reverse('logout'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get(reverse('user-profile'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_expired_token_is_rotated(self):
+        Token.objects.filter(key=self.token.key).update(created=timezone.now() - timedelta(days=1))
+        response = self.client.get(reverse('user-profile'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertFalse(Token.objects.filter(key=self.token.key).exists())
+        self.assertTrue(Token.objects.filter(user=self.user).exists())
+
+    def test_concurrent_rotation_returns_winning_key(self):
+        stale = Token.objects.get(key=self.token.key)
+        winner = rotate_token(self.token)
+        self.assertEqual(rotate_token(stale).key, winner.key)
+        self.assertEqual(Token.objects.get(user=self.user).key, winner.key)
+        Token.objects.filter(user=self.user).delete()
+        self.assertIsNone(rotate_token(winner))
+
+
+class ApiMiddlewareTestCase(APITestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='mwuser', password='testpassword')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def test_api_skips_session_csrf_and_messages(self):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(reverse('logout'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(Token.objects.filter(key=self.token.key).exists())
+        self.assertFalse(any('django_session' in query['sql'] for query in captured.captured_queries))
+        self.assertFalse(hasattr(response.wsgi_request, 'session'))
+        self.assertNotIn('Set-Cookie', response)
+
+    def test_admin_keeps_the_full_stack(self):
+        response = self.client.get('/admin/login/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(hasattr(response.wsgi_request, 'session'))
+        self.assertIn('csrftoken', response.cookies)
+
+
+class ResponseCacheTestCase(APITestCase):
+    def setUp(self):
+        # one process here, so the per-process default cache is shared enough
+        response_cache.configure(timeout=60)
+        self.addCleanup(
+            response_cache.configure, settings.RESPONSE_CACHE, settings.RESPONSE_CACHE_GENERATIONS,
+            settings.RESPONSE_CACHE_MAX_ENTRIES, settings.RESPONSE_CACHE_SECONDS,
+        )
+        self.user = get_user_model().objects.create_user(username='cacheuser', password='testpassword')
+        self.client.force_authenticate(user=self.user)
+        self.client.post(reverse('create-app'), {'name': 'Cached', 'description': 'desc'}, format='json')
+
+    def test_repeat_reads_are_served_from_the_cache(self):
+        stats = response_cache.stats()
+        first = self.client.get(reverse('user-apps'))
+        with CaptureQueriesContext(connection) as captured:
+            second = self.client.get(reverse('user-apps'))
+        self.assertEqual(len(captured), 0)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(response_cache.stats()['hits'], stats['hits'] + 1)
+        self.assertEqual(response_cache.stats()['misses'], stats['misses'] + 1)
+
+    def test_writes_invalidate_the_user(self):
+        self.assertEqual(self.client.get(reverse('user-profile')).data['app_count'], 1)
+        self.assertEqual(len(self.client.get(reverse('user-apps')).data['results']), 1)
+
+        response = self.client.post(reverse('create-app'), {'name': 'Second', 'description': 'desc'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(self.client.get(reverse('user-apps')).data['results']), 2)
+        self.assertEqual(self.client.get(reverse('user-profile')).data['app_count'], 2)
+
+        self.client.delete(reverse('delete-app', args=[response.data['id']]))
+        self.assertEqual(len(self.client.get(reverse('user-apps')).data['results']), 1)
+
+    def test_deletes_outside_the_api_invalidate_the_user(self):
+        self.assertEqual(len(self.client.get(reverse('user-apps')).data['results']), 1)
+        App.objects.get(user=self.user).delete()
+        self.assertEqual(self.client.get(reverse('user-apps')).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_refuses_a_per_process_generations_cache(self):
+        config = django_apps.get_app_config('myapp')
+        with override_settings(RESPONSE_CACHE_SECONDS=60):
+            with self.assertRaises(ImproperlyConfigured):
+                config.check_shared_caches()
+        with override_settings(RESPONSE_CACHE_SECONDS=0):
+            config.check_shared_caches()
+
+    def test_local_store_evicts_least_recently_used(self):
+        store = LocalLRU(max_entries=2)
+        store.set('a', 1, 60)
+        store.set('b', 2, 60)
+        store.get('a')
+        store.set('c', 3, 60)
+        self.assertEqual((store.get('a'), store.get('b'), store.get('c')), (1, None, 3))
+        self.assertEqual(store.evictions, 1)
+
+
+class LoginTestCase(APITestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='loginuser', password='testpassword')
+        self.url = reverse('login')
+        self.credentials = {'username': 'loginuser', 'password': 'testpassword'}
+
+    def test_login_creates_token(self):
+        # user lookup, token lookup, token insert (in a savepoint, two more statements here)
+        with self.assertNumQueries(5):
+            response = self.client.post(self.url, self.credentials, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['token'], Token.objects.get(user=self.user).key)
+
+    def test_login_rotates_expired_token_in_place(self):
+        token = Token.objects.create(user=self.user)
+        Token.objects.filter(key=token.key).update(created=timezone.now() - timedelta(days=1))
+        # user lookup, token lookup, token update
+        with self.assertNumQueries(3):
+            response = self.client.post(self.url, self.credentials, format='json')
+        self.assertNotEqual(response.data['token'], token.key)
+        self.assertEqual(Token.objects.get(user=self.user).key, response.data['token'])
+        self.assertGreater(response.data['token_expires_in'], timedelta(seconds=0))
+
+    def test_password_hash_upgraded_to_configured_iterations(self):
+        with self.settings(PASSWORD_HASH_ITERATIONS=1000):
+            response = self.client.post(self.url, self.credentials, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$1000$'))
+
+
+class RegistrationTestCase(APITestCase):
+    def test_register_uses_fixed_number_of_queries(self):
+        data = {'first_name': 'New', 'last_name': 'User', 'username': 'newuser', 'password': 'Sup3r-secret-pass',
+                'email': 'new@example.com', 'phone': '0123456789'}
+        # username uniqueness check, savepoint, user insert, token insert, release
+        with self.assertNumQueries(5):
+            response = self.client.post(reverse('register-user'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['token'], Token.objects.get(user__username='newuser').key)
+
+    def test_import_users_command(self):
+        get_user_model().objects.create_user(username='existing', password='testpassword')
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False) as export:
+            rows = [
+                {'username': 'imported', 'email': 'a@example.com', 'password': 'old-password'},
+                {'username': 'prehashed', 'password_hash': make_password('kept-password')},
+                {'username': 'existing'},
+                {'email': 'no-username@example.com'},
+                {'username': 'EXISTING'},
+                {'username': 'Imported'},
+                {'username': 'nophone', 'phone': None},
+                {'username': 'bad name!'},
+                {'username': 'bademail', 'email': 'not-an-email'},
+            ]
+            export.write('\n'.join(json.dumps(row) for row in rows))
+        self.addCleanup(os.remove, export.name)
+        out = StringIO()
+        call_command('import_users', export.name, stdout=out)
+
+        self.assertIn('created 3, skipped 3 existing, 3 invalid', out.getvalue())
+        self.assertEqual(get_user_model().objects.get(username='nophone').phone, '')
+        self.assertTrue(get_user_model().objects.get(username='imported').check_password('old-password'))
+        self.assertTrue(get_user_model().objects.get(username='prehashed').check_password('kept-password'))
+
+
+class AsyncReadEndpointsTestCase(APITestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(username='asyncuser', password='testpassword')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        self.app = App.objects.create(user=self.user, name='Async App', description='desc')
+
+    def assertSameBody(self, sync_name, async_name, *args):
+        sync_response = self.client.get(reverse(sync_name, args=args))
+        async_response = self.client.get(reverse(async_name, args=args))
+        self.assertEqual(async_response.status_code, sync_response.status_code)
+        self.assertEqual(async_response.content, sync_response.content)
+
+    def test_async_endpoints_match_sync_endpoints(self):
+        self.assertSameBody('plans', 'async-plans')
+        self.assertSameBody('app', 'async-app', self.app.id)
+        self.assertSameBody('app-subscription-detail', 'async-app-subscription-detail', self.app.id)
+
+    def test_async_include_matches_sync(self):
+        sync_response = self.client.get(reverse('app', args=[self.app.id]), {'include': 'plan'})
+        async_response = self.client.get(reverse('async-app', args=[self.app.id]), {'include': 'plan'})
+        self.assertEqual(async_response.content, sync_response.content)
+        sync_response = self.client.get(reverse('user-apps'), {'include': 'subscription'})
+        async_response = self.client.get(reverse('async-user-apps'), {'include': 'subscription'})
+        self.assertEqual(async_response.content, sync_response.content)
+
+    def test_async_listings(self):
+        response = self.client.get(reverse('async-user-apps'))
+        self.assertEqual([app['name'] for app in response.json()['results']], ['Async App'])
+        response = self.client.get(reverse('async-user-subscriptions'), {'plan': 'Free'})
+        self.assertEqual([s['app'] for s in response.json()['results']], ['Async App'])
+
+    def test_async_endpoints_require_token(self):
+        self.client.credentials()
+        response = self.client.get(reverse('async-user-apps'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.client.credentials(HTTP_AUTHORIZATION='Token invalid')
+        response = self.client.get(reverse('async-plans'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class QueryCountRegressionTestCase(APITestCase):
+    def test_query_count_does_not_grow_with_app_count(self):
+        report = run_benchmarks(sizes=[1, 25], repeat=1)
+        self.assertEqual(report['regressions'], [])
+
+
+class ProfilingMiddlewareTestCase(APITestCase):
+    def setUp(self):
+        self.dump_dir = tempfile.mkdtemp()
+        self.user = get_user_model().objects.create_user(username='profileduser', password='testpassword')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        App.objects.create(user=self.user, name='Profiled App', description='desc')
+
+    def test_sampled_request_reports_server_timing_and_dumps_histogram(self):
+        with self.settings(PROFILING_SAMPLE_RATE=1.0, PROFILING_DUMP_DIR=self.dump_dir, PROFILING_FLUSH_SECONDS=0):
+            response = self.client.get(reverse('user-subscriptions'))
+        timing = response['Server-Timing']
+        for name in ('db;', 'auth;', 'service;', 'serializer;', 'total;'):
+            self.assertIn(name, timing)
+        self.assertIn('desc="2 queries"', timing)
+
+        out = StringIO()
+        call_command('dump_profiles', dir=self.dump_dir, json=True, stdout=out)
+        histogram = json.loads(out.getvalue())['routes']['user-subscriptions']
+        self.assertGreaterEqual(histogram['requests'], 1)
+        self.assertGreater(histogram['totals']['bytes'], 0)
+
+    def test_unsampled_request_has_no_server_timing(self):
+        response = self.client.get(reverse('user-subscriptions'))
+        self.assertNotIn('Server-Timing', response)
+
+    def test_async_request_is_profiled(self):
+        async def get():
+            return await AsyncClient().get(reverse('async-user-apps'), AUTHORIZATION='Token ' + self.token.key)
+
+        with self.settings(PROFILING_SAMPLE_RATE=1.0, PROFILING_DUMP_DIR=self.dump_dir, PROFILING_FLUSH_SECONDS=0):
+            response = async_to_sync(get)()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('total;', response['Server-Timing'])
+        self.assertRegex(response['Server-Timing'], r'desc="[1-9]\d* queries"')
+
+    def test_dumps_of_gone_workers_are_skipped(self):
+        with self.settings(PROFILING_SAMPLE_RATE=1.0, PROFILING_DUMP_DIR=self.dump_dir, PROFILING_FLUSH_SECONDS=0):
+            self.client.get(reverse('user-subscriptions'))
+        with open(os.path.join(self.dump_dir, 'profile-1.json'), 'w') as dump:
+            json.dump({'written': 0, 'routes': {'gone': {'requests': 1}}, 'pools': {}}, dump)
+        out = StringIO()
+        call_command('dump_profiles', dir=self.dump_dir, json=True, stdout=out)
+        routes = json.loads(out.getvalue())['routes']
+        self.assertIn('user-subscriptions', routes)
+        self.assertNotIn('gone', routes)
+
+
+class ExpireSubscriptionsCommandTestCase(APITestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='expiryuser', password='testpassword')
+        self.apps = [App.objects.create(user=self.user, name=f'App {i}', description='desc') for i in range(5)]
+        # three of the five subscriptions ended yesterday
+        Subscription.objects.filter(app__in=self.apps[:3]).update(end_date=timezone.localdate() - timedelta(days=1))
+
+    def test_deactivates_expired_subscriptions_in_batches(self):
+        out = StringIO()
+        call_command('expire_subscriptions', batch_size=2, stdout=out)
+        self.assertEqual(Subscription.objects.filter(active=False).count(), 3)
+        self.assertIn('batch 2', out.getvalue())
+
+    def test_dry_run_changes_nothing(self):
+        out = StringIO()
+        call_command('expire_subscriptions', dry_run=True, stdout=out)
+        self.assertEqual(Subscription.objects.filter(active=False).count(), 0)
+        self.assertIn('would deactivate 3 subscriptions', out.getvalue())
+
+    def test_renew_starts_new_period(self):
+        call_command('expire_subscriptions', renew=True, stdout=StringIO())
+        today = timezone.localdate()
+        self.assertEqual(Subscription.objects.filter(active=True, start_date=today, end_date=today + timedelta(days=30)).count(), 5)
+
+
+class ChangeFeedTestCase(APITestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='feeduser', password='testpassword')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        plan_catalogue._clear()
+
+    def changes(self, cursor, **params):
+        response = self.client.get(reverse('changes'), {'cursor': cursor, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_feed_returns_compacted_changes_after_cursor(self):
+        cursor = self.client.get(reverse('changes')).data['cursor']
+        kept = self.client.post(reverse('create-app'), {'name': 'Kept', 'description': 'v1'}, format='json').data
+        gone = self.client.post(reverse('create-app'), {'name': 'Gone', 'description': 'desc'}, format='json').data
+        self.client.patch(reverse('update-app', args=[kept['id']]), {'description': 'v2'}, format='json')
+        gone_subscription = str(Subscription.objects.get(app_id=gone['id']).id)
+        self.client.delete(reverse('delete-app', args=[gone['id']]))
+
+        data = self.changes(cursor)
+        changes = {(change['kind'], change['id']): change for change in data['changes']}
+        self.assertEqual(len(data['changes']), 4)
+        self.assertEqual(changes[('app', kept['id'])]['data']['description'], 'v2')
+        self.assertEqual(changes[('app', gone['id'])]['op'], 'delete')
+        self.assertEqual(changes[('subscription', gone_subscription)]['op'], 'delete')
+        self.assertFalse(data['has_more'])
+
+        # nothing new since
+        self.assertEqual(self.changes(data['cursor'])['changes'], [])
+
+    def test_feed_pages_and_only_shows_own_changes(self):
+        cursor = self.client.get(reverse('changes')).data['cursor']
+        other = get_user_model().objects.create_user(username='feedother')
+        App.objects.create(user=other, name='Other', description='desc')
+        self.client.post(reverse('bulk-create-apps'), [{'name': f'App {i}', 'description': 'desc'} for i in range(2)], format='json')
+
+        seen = []
+        while True:
+            data = self.changes(cursor, limit=3)
+            seen += data['changes']
+            cursor = data['cursor']
+            if not data['has_more']:
+                break
+        self.assertEqual(sorted(change['kind'] for change in seen), ['app', 'app', 'subscription', 'subscription'])
+
+    def test_rejects_bad_and_expired_cursors(self):
+        response = self.client.get(reverse('changes'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        with override_settings(CHANGE_FEED_RETENTION_DAYS=0):
+            response = self.client.get(reverse('changes'), {'cursor': ChangeFeedService.encode_cursor(0)})
+        self.assertEqual(response.status_code, status.HTTP_410_GONE)
+
+    def test_cursor_expires_with_the_entries_after_it(self):
+        cursor = self.client.get(reverse('changes')).data['cursor']
+        for name in ('Old 1', 'Old 2'):
+            App.objects.create(user=self.user, name=name, description='desc')
+        Change.objects.filter(user=self.user).update(created_at=timezone.now() - timedelta(days=8))
+        # the page stops inside entries past the retention, so compaction may remove the rest
+        data = self.changes(cursor, limit=1)
+        self.assertTrue(data['has_more'])
+        response = self.client.get(reverse('changes'), {'cursor': data['cursor']})
+        self.assertEqual(response.status_code, status.HTTP_410_GONE)
+        # a cursor that reached the end of the log stays valid however old its entries are
+        data = self.changes(cursor, limit=100)
+        self.assertFalse(data['has_more'])
+        self.assertEqual(self.changes(data['cursor'])['changes'], [])
+
+    def test_compaction_drops_superseded_and_expired_entries(self):
+        app = App.objects.create(user=self.user, name='App', description='desc')
+        ChangeFeedService.record([(self.user.pk, Change.APP, app.pk, Change.UPSERT)] * 3)
+        old = uuid.uuid4()
+        ChangeFeedService.record([(self.user.pk, Change.APP, old, Change.DELETE)])
+        Change.objects.filter(object_id=old).update(created_at=timezone.now() - timedelta(days=30))
+
+        out = StringIO()
+        call_command('compact_changes', batch_size=1, stdout=out)
+        self.assertIn('removed 2 superseded and 1 expired entries', out.getvalue())
+        # the latest entry of each live object is kept
+        self.assertEqual(Change.objects.filter(object_id=app.pk).count(), 1)
+
+
+class PurgeExpiredTokensCommandTestCase(APITestCase):
+    def setUp(self):
+        User = get_user_model()
+        expired = timezone.now() - timedelta(seconds=settings.TOKEN_EXPIRED_AFTER_SECONDS + 60)
+        for i in range(5):
+            token = Token.objects.create(user=User.objects.create_user(username=f'tokenuser{i}'))
+            if i < 3:
+                Token.objects.filter(pk=token.pk).update(created=expired)
+
+    def test_deletes_expired_tokens_in_batches(self):
+        out = StringIO()
+        call_command('purge_expired_tokens', batch_size=2, stdout=out)
+        self.assertEqual(Token.objects.count(), 2)
+        self.assertIn('batch 2: deleted 1 tokens', out.getvalue())
+        self.assertIn('deleted 3 expired tokens in 2 batches', out.getvalue())
+
+    def test_dry_run_changes_nothing(self):
+        out = StringIO()
+        call_command('purge_expired_tokens', dry_run=True, stdout=out)
+        self.assertEqual(Token.objects.count(), 5)
+        self.assertIn('would delete 3 expired tokens', out.getvalue())
+
+
+class CounterTestCase(APITestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='counteruser', password='testpassword')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        self.free, _ = Plan.objects.get_or_create(name='Free', defaults={'price': 0.00})
+        self.pro, _ = Plan.objects.get_or_create(name='Pro', defaults={'price': 25.00})
+        plan_catalogue._clear()
+
+    def profile(self):
+        return self.client.get(reverse('user-profile')).data
+
+    def test_counters_follow_create_update_and_delete(self):
+        for i in range(3):
+            self.client.post(reverse('create-app'), {'name': f'App {i}', 'description': 'desc'}, format='json')
+        app = App.objects.get(name='App 0')
+        subscription = Subscription.objects.get(app=app)
+        self.client.patch(reverse('update-subscription', args=[subscription.id]), {'plan': str(self.pro.id)}, format='json')
+        profile = self.profile()
+        self.assertEqual(profile['app_count'], 3)
+        self.assertEqual(profile['active_subscriptions']['Free'], 2)
+        self.assertEqual(profile['active_subscriptions']['Pro'], 1)
+
+        self.client.delete(reverse('delete-app', args=[app.id]))
+        profile = self.profile()
+        self.assertEqual(profile['app_count'], 2)
+        self.assertEqual(profile['active_subscriptions']['Free'], 2)
+        self.assertEqual(profile['active_subscriptions']['Pro'], 0)
+
+    def test_app_quota_is_enforced(self):
+        with self.settings(MAX_APPS_PER_USER=2):
+            for i in range(2):
+                response = self.client.post(reverse('create-app'), {'name': f'App {i}', 'description': 'desc'}, format='json')
+                self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            response = self.client.post(reverse('create-app'), {'name': 'App 2', 'description': 'desc'}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            data = [{'name': 'Bulk', 'description': 'desc'}]
+            response = self.client.post(reverse('bulk-create-apps'), data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(App.objects.filter(user=self.user).count(), 2)
+
+    def test_reconcile_repairs_drift(self):
+        # apps created through the ORM bypass the counters
+        for i in range(2):
+            App.objects.create(user=self.user, name=f'App {i}', description='desc')
+        out = StringIO()
+        call_command('reconcile_counters', batch_size=1, stdout=out)
+        self.assertIn('repaired 2 counters', out.getvalue())
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.app_count, 2)
+        self.assertEqual(PlanSubscriptionCount.objects.get(user=self.user, plan=self.free).active, 2)
+
+
+class RowShapeTestCase(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='rowuser', password='testpassword')
+        for name in ('Plain', 'Ünïcode \u2028 app', 'Quote " app', 'Planless'):
+            App.objects.create(user=self.user, name=name, description='desc')
+        Subscription.objects.filter(app__name='Plain').update(plan=Plan.objects.get(name='Pro'), active=False)
+        # as left behind by a deleted plan (on_delete=SET_NULL)
+        Subscription.objects.filter(app__name='Planless').update(plan=None)
+
+    def assertSameBytes(self, serializer_data, rows):
+        renderer = JSONRenderer()
+        self.assertEqual(renderer.render(rows), renderer.render(serializer_data))
+
+    def test_app_rows_match_serializer(self):
+        apps = App.objects.filter(user=self.user).order_by('name', 'id')
+        self.assertSameBytes(AppSerializer(apps, many=True).data, APP_ROWS.rows(APP_ROWS.values(apps)))
+
+    def test_subscription_rows_match_serializer(self):
+        subscriptions = Subscription.objects.filter(app__user=self.user).select_related('app', 'plan').order_by('start_date', 'id')
+        self.assertSameBytes(
+            SubscriptionSerializer(subscriptions, many=True).data,
+            SUBSCRIPTION_ROWS.rows(SUBSCRIPTION_ROWS.values(subscriptions)),
+        )
+
+
+class TimeOrderedIdTestCase(TestCase):
+    def test_uuid7_is_version_7_and_increasing(self):
+        ids = [uuid7() for _ in range(5000)]
+        self.assertEqual({(value.version, value.variant) for value in ids}, {(7, uuid.RFC_4122)})
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual(len(set(ids)), len(ids))
+
+    def test_new_rows_get_time_ordered_ids(self):
+        user = get_user_model().objects.create_user(username='iduser', password='testpassword')
+        first = App.objects.create(user=user, name='First', description='desc')
+        second = App.objects.create(user=user, name='Second', description='desc')
+        self.assertEqual(first.id.version, 7)
+        self.assertLess(first.id, second.id)
+        self.assertEqual(Subscription.objects.get(app=second).id.version, 7)
+
+    def test_binary_storage_on_mysql(self):
+        mysql = SimpleNamespace(vendor='mysql')
+        field = BinaryUUIDField()
+        value = uuid7()
+        self.assertEqual(field.db_type(mysql), 'binary(16)')
+        self.assertEqual(field.get_db_prep_value(str(value), mysql), value.bytes)
+        self.assertIsNone(field.get_db_prep_value(None, mysql))
+        # and the backend reads the bytes back, CHAR(32) uuids still work
+        operations = MySQLOperations(connection=None)
+        self.assertEqual(operations.convert_uuidfield_value(value.bytes, None, None), value)
+        self.assertEqual(operations.convert_uuidfield_value(value.hex, None, None), value)
+
+    def test_key_benchmark(self):
+        results = run_key_benchmark(rows=50, batch_size=20)
+        self.assertEqual([row['generator'] for row in results], ['uuid4', 'uuid7'])
+        self.assertTrue(all(row['rows'] == 50 and row['rows_per_s'] for row in results))
+
+
+class ReplicaRouterTestCase(SimpleTestCase):
+    @override_settings(DATABASE_REPLICAS=['replica'])
+    def test_reads_go_to_replicas_unless_pinned(self):
+        router = ReplicaRouter()
+        self.assertEqual(router.db_for_read(App), 'replica')
+        self.assertEqual(router.db_for_write(App), 'default')
+        # freshly issued tokens must authenticate straight away
+        self.assertEqual(router.db_for_read(Token), 'default')
+        with primary():
+            self.assertEqual(router.db_for_read(App), 'default')
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas_everything_uses_default(self):
+        self.assertEqual(ReplicaRouter().db_for_read(App), 'default')
+
+    @override_settings(DATABASE_REPLICAS=['replica'])
+    def test_pinning_middleware_stays_async(self):
+        caches[settings.REPLICA_PIN_CACHE].clear()
+
+        async def view(request):
+            return HttpResponse(str(use_primary.get()))
+
+        middleware = ReplicaPinningMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        factory = RequestFactory(HTTP_AUTHORIZATION='Token pinned')
+        self.assertEqual(async_to_sync(middleware)(factory.get('/api/v1/apps')).content, b'False')
+        self.assertEqual(async_to_sync(middleware)(factory.post('/api/v1/apps')).content, b'True')
+        # the writer's next read stays on the primary
+        self.assertEqual(async_to_sync(middleware)(factory.get('/api/v1/apps')).content, b'True')
+
+    @override_settings(DATABASE_REPLICAS=['replica'], RESPONSE_CACHE_SECONDS=0,
+                       CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_refuses_per_process_replica_pins(self):
+        with self.assertRaises(ImproperlyConfigured):
+            django_apps.get_app_config('myapp').check_shared_caches()
+
+
+@skipUnless('replica' in settings.DATABASES, 'needs appmanager.settings_replica_sqlite')
+class ReplicaRoutingTestCase(TransactionTestCase):
+    """Runs against two unreplicated SQLite files, so replica reads miss primary writes."""
+    databases = {'default', *settings.DATABASE_REPLICAS}
+
+    def setUp(self):
+        caches[settings.REPLICA_PIN_CACHE].clear()
+        plan_catalogue._clear()
+        self.user = get_user_model().objects.create_user(username='replicauser', password='testpassword')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        for name, price in (('Free', 0), ('Standard', 10), ('Pro', 25)):
+            Plan.objects.using('replica').get_or_create(name=name, defaults={'price': price})
+
+    def test_reads_follow_the_writer_then_return_to_the_replica(self):
+        response = self.client.post(reverse('create-app'), {'name': 'Mine', 'description': 'desc'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        # pinned: the primary holds the new app
+        self.assertEqual(self.client.get(reverse('app', args=[response.data['id']])).status_code, status.HTTP_200_OK)
+
+        caches[settings.REPLICA_PIN_CACHE].clear()
+        # unpinned: the (never replicated) replica doesn't know it
+        self.assertEqual(self.client.get(reverse('app', args=[response.data['id']])).status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ConnectionLimiterTestCase(SimpleTestCase):
+    def test_threads_exiting_with_an_open_connection_give_the_slot_back(self):
+        # runserver and ASGI: one short-lived thread per request, the
+        # persistent connection is never closed by the request
+        limiter = ConnectionLimiter(size=2, timeout=0.5)
+        connections_opened = []
+
+        def request():
+            limiter.acquire()
+            connection = sqlite3.connect(':memory:', check_same_thread=False)
+            connections_opened.append(connection)
+            limiter.hold(connection)
+
+        for _ in range(6):
+            thread = threading.Thread(target=request)
+            thread.start()
+            thread.join()
+        stats = limiter.stats()
+        self.assertEqual((stats['in_use'], stats['checkouts'], stats['timeouts'], stats['reclaimed']), (0, 6, 0, 6))
+        with self.assertRaises(sqlite3.ProgrammingError):
+            connections_opened[0].execute('SELECT 1')
+
+    def test_closed_connection_releases_once(self):
+        limiter = ConnectionLimiter(size=1, timeout=0.01)
+        limiter.acquire()
+        slot = limiter.hold(sqlite3.connect(':memory:'))
+        slot.release()
+        slot.release()
+        self.assertEqual(limiter.stats()['in_use'], 0)
+        limiter.acquire()
+
+
+    def test_checkout_stats(self):
+        limiter = ConnectionLimiter(size=2, timeout=0.01)
+        limiter.acquire()
+        limiter.acquire()
+        stats = limiter.stats()
+        self.assertEqual(stats['in_use'], 2)
+        self.assertEqual(stats['saturation'], 1.0)
+        self.assertEqual(stats['opened_last_minute'], 2)
+
+        with self.assertRaises(OperationalError):
+            limiter.acquire()
+        self.assertEqual(limiter.stats()['timeouts'], 1)
+
+        limiter.release()
+        limiter.acquire()
+        self.assertEqual(limiter.stats()['checkouts'], 3)
 
-    
@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import views, async_views
 from rest_framework.urlpatterns import format_suffix_patterns
 
 #AUTH
@@ -16,6 +16,8 @@ urlpatterns = [
     
     #app
     path('create-app', views.create_app, name='create-app'),
+    path('apps/bulk', views.bulk_create_apps, name='bulk-create-apps'),
+    path('apps', views.bulk_delete_apps, name='bulk-delete-apps'),
     path('user-apps', views.get_user_apps, name='user-apps'),
     path('app/<uuid:app_id>/', views.get_app, name='app'),
     path('app/<uuid:pk>/update', views.update_app, name='update-app'),
@@ -25,9 +27,20 @@ urlpatterns = [
     path('subscriptions/', views.get_user_subscriptions, name='user-subscriptions'),
     path('app/<uuid:app_id>/subscription/', views.get_user_app_subscription, name='app-subscription-detail'),  
     path('subscription/<uuid:pk>/update/', views.update_subscription, name='update-subscription'),
+    path('subscriptions/plan', views.bulk_change_plan, name='bulk-change-plan'),
    
     #plan
     path('plans/', views.get_plans, name='plans'),
+
+    #incremental sync
+    path('changes', views.get_changes, name='changes'),
+
+    ##ASYNC read endpoints, for ASGI deployments
+    path('async/user-apps', async_views.get_user_apps, name='async-user-apps'),
+    path('async/app/<uuid:app_id>/', async_views.get_app, name='async-app'),
+    path('async/subscriptions/', async_views.get_user_subscriptions, name='async-user-subscriptions'),
+    path('async/app/<uuid:app_id>/subscription/', async_views.get_user_app_subscription, name='async-app-subscription-detail'),
+    path('async/plans/', async_views.get_plans, name='async-plans'),
 ]
 
 urlpatterns = format_suffix_patterns(urlpatterns)
\ No newline at end of file
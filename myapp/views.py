@@ -9,6 +9,8 @@ from django.http import Http404
 from .services.user_service import UserService
 from .services.app_service import AppService
 from .services.subscription_service import SubscriptionService, PlanService
+from .services.change_service import ChangeFeedService
+from .response_cache import cached_per_user
 from django.core.exceptions import PermissionDenied, ValidationError
 
 @api_view(["POST"])
@@ -26,6 +28,7 @@ def login(request):
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
+@cached_per_user
 def userProfile(request):
     return UserService.userProfile(request)
     
@@ -42,6 +45,12 @@ def create_app(request):
     app_service = AppService()
     return app_service.create_app(request.data, request.user)
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def bulk_create_apps(request):
+    app_service = AppService()
+    return app_service.bulk_create_apps(request.data, request.user)
+
 @api_view(['PUT', 'PATCH'])  # 'PUT' for full updates, 'PATCH' for partial updates
 @permission_classes([IsAuthenticated])
 def update_app(request, pk):
@@ -61,20 +70,27 @@ def delete_app(request, app_id):
     message, status_code = app_service.delete_app_and_subscriptions(request.user, app_id)
     return Response({"response": message}, status=status_code)
 
+@api_view(['DELETE'])
+@permission_classes([IsAuthenticated])
+def bulk_delete_apps(request):
+    app_service = AppService()
+    response_data, status_code = app_service.bulk_delete_apps(request.user, request.data)
+    return Response(response_data, status=status_code)
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cached_per_user
 def get_user_apps(request):
     app_service = AppService()
-    response = app_service.get_apps_for_user(request.user)
-    return Response(response.data)
+    return app_service.get_apps_for_user(request.user, request)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cached_per_user
 def get_app(request, app_id):
     app_service = AppService()
     try:
-        response_data = app_service.get_app(request.user, app_id)
-        return Response(response_data) 
+        return app_service.get_app(request.user, app_id, request)
     except Http404 as e:
         return Response({'error': str(e)}, status=status.HTTP_404_NOT_FOUND)
 
@@ -82,7 +98,7 @@ def get_app(request, app_id):
 @permission_classes([IsAuthenticated])
 def get_user_app_subscription(request, app_id):
     subscription_service = SubscriptionService()
-    return subscription_service.get_subscription(request.user, app_id)
+    return subscription_service.get_subscription(request.user, app_id, request)
 
 @api_view(['PATCH'])
 @permission_classes([IsAuthenticated])
@@ -98,16 +114,27 @@ def update_subscription(request, pk):
     except ValidationError as e:
         return Response(e.detail, status=status.HTTP_400_BAD_REQUEST)
     
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def bulk_change_plan(request):
+    subscription_service = SubscriptionService()
+    response_data, status_code = subscription_service.bulk_change_plan(request.user, request.data)
+    return Response(response_data, status=status_code)
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cached_per_user
 def get_user_subscriptions(request):
     subscription_service = SubscriptionService()
-    response = subscription_service.get_user_subscriptions(request.user)
-    return Response(response.data)
+    return subscription_service.get_user_subscriptions(request.user, request)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_plans(request):
     plan_service = PlanService()
-    response = plan_service.get_plans()
-    return Response(response.data)
+    return plan_service.get_plans(request)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_changes(request):
+    return ChangeFeedService.get_changes(request.user, request)